@@ -0,0 +1,69 @@
+# Check the targeted NIK/KK result extractor against the old BeautifulSoup
+# parse and time both.
+# Usage: python bench/bench_extract.py [saved_result_page.html ...]
+#
+# Without arguments the fixtures in bench/fixtures are used and compared with
+# expected.json. Pass freshly saved result pages to check that the live layout
+# still has the markers the extractor relies on; exits non-zero on any mismatch.
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.extract import extract_nik_result
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# The extraction check_nik_kk used before core.extract
+def reference_extract(html):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    nik_result = soup.find("h6")
+    nomor_result = soup.find("ul", class_="list-unstyled margin-5-top")
+    if nik_result and nomor_result:
+        return nik_result.text.strip(), [nomor.text.strip() for nomor in nomor_result.find_all("li")]
+    return None
+
+def as_output(extracted):
+    if extracted is None:
+        return None
+    nik, nomor = extracted
+    return {"nik": nik, "nomor": nomor, "sisa": 3 - len(nomor)}
+
+def main():
+    if len(sys.argv) > 1:
+        pages = {path: None for path in sys.argv[1:]}
+        expected = {}
+    else:
+        with open(os.path.join(FIXTURES, "expected.json")) as file:
+            expected = json.load(file)
+        pages = {os.path.join(FIXTURES, name): name for name in expected}
+
+    failures = 0
+    print(f"{'page':<28} {'bs4 ms':>8} {'fast ms':>8} {'speedup':>8}  check")
+    for path, name in pages.items():
+        with open(path, encoding="utf-8") as file:
+            html = file.read()
+
+        fast = as_output(extract_nik_result(html))
+        reference = as_output(reference_extract(html))
+        if fast != reference:
+            status = f"MISMATCH with bs4: {fast} != {reference}"
+        elif name is not None and fast != expected[name]:
+            status = f"MISMATCH with expected.json: {fast}"
+        elif name is None and fast is None:
+            status = "NO RESULT FOUND (layout changed or not a result page)"
+        else:
+            status = "ok"
+        failures += status != "ok"
+
+        runs = 200
+        bs4_ms = timeit.timeit(lambda: reference_extract(html), number=runs) / runs * 1000
+        fast_ms = timeit.timeit(lambda: extract_nik_result(html), number=runs) / runs * 1000
+        print(f"{os.path.basename(path):<28} {bs4_ms:>8.2f} {fast_ms:>8.2f} {bs4_ms / fast_ms:>7.1f}x  {status}")
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
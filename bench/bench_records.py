@@ -0,0 +1,54 @@
+# Compare the memory held by a finished SIM job kept as per-row dicts (the old
+# record shape), as slotted SimRecord objects and as RecordColumns.
+# Usage: python bench/bench_records.py [rows ...]   (default: 10000 100000)
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.results import RecordColumns, SimRecord
+
+STATUSES = ("AKTIF", "TIDAK AKTIF", "TERBLOKIR")
+
+# Rows are rebuilt from JSON, as they arrive from the upstream, so strings are not shared up front
+def make_rows(count):
+    for i in range(count):
+        if i % 7:
+            yield json.loads(json.dumps({"msisdn": f"62896{i:08d}", "status": True, "card_status": STATUSES[i % 3],
+                                         "activation_status": STATUSES[i % 2], "last_4_iccid": f"{i % 10000:04d}",
+                                         "message": ""}))
+        else:
+            yield json.loads(json.dumps({"msisdn": f"62896{i:08d}", "status": False, "card_status": "",
+                                         "activation_status": "", "last_4_iccid": "",
+                                         "message": "Nomor tidak terdaftar"}))
+
+def as_dicts(count):
+    return list(make_rows(count))
+
+def as_records(count):
+    return [SimRecord(**row) for row in make_rows(count)]
+
+def as_columns(count):
+    columns = RecordColumns("sim")
+    columns.extend(SimRecord(**row) for row in make_rows(count))
+    return columns
+
+def measure(build, count):
+    tracemalloc.start()
+    held = build(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current / 1024 / 1024
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print(f"{'rows':>8} {'container':>10} {'held MiB':>9} {'bytes/row':>10}")
+    for count in counts:
+        for name, build in (("dicts", as_dicts), ("records", as_records), ("columns", as_columns)):
+            held = measure(build, count)
+            print(f"{count:>8} {name:>10} {held:>9.1f} {held * 1024 * 1024 / count:>10.0f}")
+
+if __name__ == "__main__":
+    main()
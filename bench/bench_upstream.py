@@ -0,0 +1,161 @@
+# Offline throughput benchmark of the lookup paths against bench/mock_upstream.py.
+# Reports rows/sec, p50/p95/p99 lookup latency, peak RSS and how many lookups
+# found a result or failed against the upstream, for:
+#   single  one lookup at a time, as /cekstatus and /ceknik answer a command
+#   list    a pasted list through iter_*_records and a CSV export
+#   sheet   a spreadsheet export streamed from a URL through the same pipeline
+# Usage: python bench/bench_upstream.py [--rows 2000] [--single-rows 200]
+#            [--paths single,list,sheet] [--kinds sim,nik] [--rate 1000]
+#            [--latency 0.05] [--jitter 0.02] [--error-rate 0] [--throttle-rate 0]
+#
+# The mock servers run in their own process and every path runs in a fresh
+# process, so peak RSS is per path. Inputs are unique, so every row reaches
+# the mock. Latency is measured per lookup and includes the wait for a rate
+# limit token, retries and re-queued 429s.
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOCK = os.path.join(ROOT, "bench", "mock_upstream.py")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def inputs(kind, rows):
+    if kind == "sim":
+        return [f"0896{i:08d}" for i in range(rows)]
+    return [(f"3201{i:012d}", f"3201{i + 500000:012d}") for i in range(rows)]
+
+# Runs inside the per-path process; TRI_BASE_URL/IM3_BASE_URL already point at the mocks
+async def run_path(path, kind, rows):
+    sys.path.insert(0, ROOT)
+    import core.bulk as bulk
+    from core.config import IM3_BASE_URL, TRI_BASE_URL
+    from core.sheets import stream_msisdns, stream_nik_pairs
+    from core.upstream import check_nik_kk, check_sim_status, close_clients
+    from core.writers import write_job
+
+    latencies = []
+    answers = {"found": 0, "failed": 0}
+
+    def timed(lookup):
+        async def wrapper(*args):
+            started = time.perf_counter()
+            result = await lookup(*args)
+            latencies.append(time.perf_counter() - started)
+            if result.status:
+                answers["found"] += 1
+            elif result.transient:
+                answers["failed"] += 1
+            return result
+        return wrapper
+
+    # iter_batch looks the lookup functions up in core.bulk, so timing them there covers the batch paths
+    bulk.check_sim_status = timed(check_sim_status)
+    bulk.check_nik_kk = timed(check_nik_kk)
+
+    started = time.perf_counter()
+    if path == "single":
+        for row in inputs(kind, rows):
+            await (bulk.check_sim_status(row) if kind == "sim" else bulk.check_nik_kk(*row))
+    else:
+        if path == "list":
+            source = inputs(kind, rows)
+        elif kind == "sim":
+            source = stream_msisdns(f"{TRI_BASE_URL}/sheet.csv?kind=sim&rows={rows}")
+        else:
+            source = stream_nik_pairs(f"{IM3_BASE_URL}/sheet.csv?kind=nik&rows={rows}")
+        records = bulk.iter_sim_records(source) if kind == "sim" else bulk.iter_nik_records(source)
+        filename = await write_job(records, kind, "csv", prefix="bench")
+        os.remove(filename)
+    elapsed = time.perf_counter() - started
+    await close_clients()
+
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "path": path, "kind": kind, "rows": len(latencies), "seconds": elapsed,
+        "rows_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": cuts[49] * 1000, "p95": cuts[94] * 1000, "p99": cuts[98] * 1000,
+        "peak_rss": peak_rss_mib(), "found": answers["found"], "failed": answers["failed"],
+    }
+
+def start_mocks(args, sim_port, nik_port):
+    command = [sys.executable, MOCK, "--sim-port", str(sim_port), "--nik-port", str(nik_port),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+               "--throttle-rate", str(args.throttle_rate), "--retry-after", str(args.retry_after)]
+    mocks = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    # The mock prints its base URLs once both ports are listening
+    if not mocks.stdout.readline():
+        raise SystemExit("mock upstream failed to start")
+    return mocks
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the lookup paths")
+    parser.add_argument("--rows", type=int, default=2000, help="rows per list and sheet run")
+    parser.add_argument("--single-rows", type=int, default=200, help="rows per single-lookup run")
+    parser.add_argument("--paths", default="single,list,sheet")
+    parser.add_argument("--kinds", default="sim,nik")
+    parser.add_argument("--rate", type=float, default=1000.0, help="UPSTREAM_RATE for the run (requests/second)")
+    parser.add_argument("--concurrency", type=int, default=None, help="BULK_CONCURRENCY (default: config)")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--run", nargs=3, metavar=("PATH", "KIND", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        path, kind, rows = args.run
+        print(json.dumps(asyncio.run(run_path(path, kind, int(rows)))))
+        return
+
+    sim_port, nik_port = free_port(), free_port()
+    mocks = start_mocks(args, sim_port, nik_port)
+    print(f"mock latency {args.latency * 1000:.0f}+/-{args.jitter * 1000:.0f} ms, errors {args.error_rate:.0%}, "
+          f"429s {args.throttle_rate:.0%}; UPSTREAM_RATE {args.rate:g}/s")
+    print(f"{'path':>7} {'kind':>5} {'rows':>6} {'rows/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'RSS MiB':>8} {'found':>6} {'failed':>7}")
+    failed_runs = 0
+    try:
+        with tempfile.TemporaryDirectory() as job_dir:
+            env = dict(os.environ, TRI_BASE_URL=f"http://127.0.0.1:{sim_port}",
+                       IM3_BASE_URL=f"http://127.0.0.1:{nik_port}", UPSTREAM_RATE=str(args.rate),
+                       STATE_BACKEND="memory", JOB_DIR=job_dir)
+            if args.concurrency:
+                env["BULK_CONCURRENCY"] = str(args.concurrency)
+            for path in args.paths.split(","):
+                for kind in args.kinds.split(","):
+                    rows = args.single_rows if path == "single" else args.rows
+                    run = subprocess.run([sys.executable, __file__, "--run", path, kind, str(rows)],
+                                         env=env, capture_output=True, text=True)
+                    if run.returncode:
+                        failed_runs += 1
+                        print(f"{path:>7} {kind:>5} failed:\n{run.stderr}")
+                        continue
+                    r = json.loads(run.stdout.splitlines()[-1])
+                    print(f"{r['path']:>7} {r['kind']:>5} {r['rows']:>6} {r['rows_per_sec']:>8.1f} {r['p50']:>8.1f} "
+                          f"{r['p95']:>8.1f} {r['p99']:>8.1f} {r['peak_rss']:>8.1f} {r['found']:>6} {r['failed']:>7}")
+    finally:
+        mocks.terminate()
+        mocks.wait()
+    sys.exit(1 if failed_runs else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Compare the old pandas Excel export with the streaming openpyxl writer.
+# Usage: python bench/bench_xlsx.py [rows ...]   (default: 10000 100000)
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.results import KINDS, NikRecord
+from core.writers import render_results
+
+def make_records(count):
+    for i in range(count):
+        nik = f"{3201010101000000 + i:016d}"
+        kk = f"0{3201010101000000 + i:015d}"
+        if i % 5:
+            yield NikRecord(nik, kk, True, nomor=(f"0812{i:08d}", f"0857{i:08d}"), sisa=1)
+        else:
+            yield NikRecord(nik, kk, False, message="Data tidak ditemukan atau format respons berubah.")
+
+def pandas_export(count, filename):
+    import pandas as pd
+    columns, to_row, _ = KINDS["nik"]
+    rows = [to_row(record) for record in make_records(count)]
+    pd.DataFrame(rows, columns=columns).to_excel(filename, index=False)
+
+def streaming_export(count, filename):
+    render_results(make_records(count), "nik", "excel", filename=filename)
+
+# Timing and peak memory come from separate runs; tracing slows the export down
+def measure(export, count, filename):
+    started = time.perf_counter()
+    export(count, filename)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    export(count, filename)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'rows':>8} {'writer':>10} {'seconds':>9} {'peak MiB':>9}")
+        for count in counts:
+            for name, export in (("pandas", pandas_export), ("streaming", streaming_export)):
+                elapsed, peak = measure(export, count, os.path.join(tmp, f"{name}.xlsx"))
+                print(f"{count:>8} {name:>10} {elapsed:>9.2f} {peak:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Regression check for core.scheduler.FairLimiter: cancelling lookups must
+# hand back every slot, whichever order the holders and waiters are cancelled in.
+# Usage: python bench/check_scheduler.py
+#
+# Exits non-zero on any failed check.
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.scheduler import FairLimiter, current_user
+
+async def lookup(limiter, user, started):
+    current_user.set(user)
+    async with limiter:
+        started.append(user)
+        await asyncio.sleep(3600)
+
+# Two users' jobs share a limit of 2: user 1 holds both slots, user 2 waits
+async def crowded(limiter):
+    started = []
+    holders = [asyncio.create_task(lookup(limiter, 1, started)) for _ in range(2)]
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(lookup(limiter, 2, started)) for _ in range(2)]
+    await asyncio.sleep(0)
+    return holders, waiters, started
+
+async def settle(tasks):
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def run_checks():
+    results = []
+
+    # iter_batch's finally cancels in input order: in-flight lookups, then waiting ones
+    limiter = FairLimiter(2)
+    holders, waiters, _ = await crowded(limiter)
+    for task in holders + waiters:
+        task.cancel()
+    await settle(holders + waiters)
+    results.append((f"holders cancelled before waiters free every slot (active {limiter.active}, "
+                    f"{limiter._active_by_user})", limiter.active == 0 and not limiter._active_by_user))
+    results.append(("no waiters left behind", not limiter._waiters))
+
+    limiter = FairLimiter(2)
+    holders, waiters, _ = await crowded(limiter)
+    for task in waiters + holders:
+        task.cancel()
+    await settle(holders + waiters)
+    results.append((f"waiters cancelled before holders free every slot (active {limiter.active})",
+                    limiter.active == 0 and not limiter._waiters))
+
+    # Cancelling only the holders hands their slots to the waiting user
+    limiter = FairLimiter(2)
+    holders, waiters, started = await crowded(limiter)
+    for task in holders:
+        task.cancel()
+    await settle(holders)
+    await asyncio.sleep(0)
+    results.append((f"waiting user gets the freed slots ({limiter._active_by_user})",
+                    limiter._active_by_user == {2: 2} and started.count(2) == 2))
+    for task in waiters:
+        task.cancel()
+    await settle(waiters)
+    results.append((f"limiter is empty afterwards (active {limiter.active})", limiter.active == 0))
+
+    # A limiter that went through the cancels still admits new lookups
+    started = []
+    task = asyncio.create_task(lookup(limiter, 3, started))
+    await asyncio.sleep(0)
+    results.append(("new lookup admitted after the cancels", started == [3]))
+    task.cancel()
+    await settle([task])
+    return results
+
+def main():
+    results = asyncio.run(run_checks())
+    for name, passed in results:
+        print(f"{'OK  ' if passed else 'FAIL'} {name}")
+    sys.exit(0 if all(passed for _, passed in results) else 1)
+
+if __name__ == "__main__":
+    main()
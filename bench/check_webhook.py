@@ -0,0 +1,120 @@
+# Integration check for webhook mode: start the webhook listener the way
+# core.runner configures it, post synthetic Telegram updates to it and check
+# which ones reach the handlers.
+# Usage: python bench/check_webhook.py
+#
+# No Telegram traffic is made: the bot's getMe/setWebhook/deleteWebhook calls
+# are answered locally. Needs python-telegram-bot[webhooks]; exits non-zero on
+# any failed check.
+import asyncio
+import os
+import socket
+import sys
+import time
+
+# Configure webhook mode before core.config reads the environment
+with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    PORT = sock.getsockname()[1]
+os.environ.update({
+    "BOT_MODE": "webhook",
+    "WEBHOOK_URL": "https://bot.example.com",
+    "WEBHOOK_LISTEN": "127.0.0.1",
+    "WEBHOOK_PORT": str(PORT),
+    "WEBHOOK_PATH": "telegram",
+    "WEBHOOK_SECRET": "check-secret",
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+from telegram import User
+from telegram.ext import Application, CommandHandler, ExtBot
+from core.runner import webhook_enabled, webhook_options
+
+# Bot that answers the calls made while starting and stopping a webhook locally
+class OfflineBot(ExtBot):
+    webhook_calls = []
+
+    async def get_me(self, *args, **kwargs):
+        self._bot_user = User(id=1, first_name="Check", is_bot=True, username="check_bot")
+        return self._bot_user
+
+    async def set_webhook(self, url, *args, **kwargs):
+        self.webhook_calls.append(("set", url, kwargs.get("secret_token")))
+        return True
+
+    async def delete_webhook(self, *args, **kwargs):
+        self.webhook_calls.append(("delete",))
+        return True
+
+def synthetic_update(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Tester"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+async def run_checks():
+    received = []
+
+    async def record(update, context):
+        received.append(update.update_id)
+
+    options = webhook_options()
+    application = Application.builder().bot(OfflineBot("123:check")).build()
+    application.add_handler(CommandHandler("start", record))
+
+    await application.initialize()
+    await application.updater.start_webhook(**options)
+    await application.start()
+
+    url = f"http://127.0.0.1:{PORT}/{options['url_path']}"
+    good = {"X-Telegram-Bot-Api-Secret-Token": options["secret_token"]}
+    bad = {"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+    results = []
+    try:
+        async with httpx.AsyncClient() as client:
+            started = time.perf_counter()
+            ok = await client.post(url, json=synthetic_update(1, "/start"), headers=good)
+            latency_ms = (time.perf_counter() - started) * 1000
+            forbidden = await client.post(url, json=synthetic_update(2, "/start"), headers=bad)
+            missing = await client.post(url, json=synthetic_update(3, "/start"))
+            wrong_path = await client.post(f"http://127.0.0.1:{PORT}/other", json=synthetic_update(4, "/start"), headers=good)
+            burst = await asyncio.gather(*(client.post(url, json=synthetic_update(n, "/start"), headers=good)
+                                           for n in range(10, 60)))
+        # Updates are queued by the listener and handled asynchronously
+        for _ in range(50):
+            if len(received) >= 51:
+                break
+            await asyncio.sleep(0.05)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+    results.append(("webhook mode enabled by config", webhook_enabled()))
+    results.append(("setWebhook got public URL and secret",
+                    ("set", "https://bot.example.com/telegram", "check-secret") in OfflineBot.webhook_calls))
+    results.append((f"valid update accepted ({ok.status_code}, {latency_ms:.1f} ms)", ok.status_code == 200))
+    results.append((f"wrong secret rejected ({forbidden.status_code})", forbidden.status_code == 403))
+    results.append((f"missing secret rejected ({missing.status_code})", missing.status_code == 403))
+    results.append((f"unknown path rejected ({wrong_path.status_code})", wrong_path.status_code == 404))
+    results.append(("burst of 50 updates accepted", all(response.status_code == 200 for response in burst)))
+    results.append((f"handlers saw only authenticated updates ({len(received)})",
+                    sorted(received) == [1] + list(range(10, 60))))
+    return results
+
+def main():
+    results = asyncio.run(run_checks())
+    for name, passed in results:
+        print(f"{'OK  ' if passed else 'FAIL'} {name}")
+    sys.exit(0 if all(passed for _, passed in results) else 1)
+
+if __name__ == "__main__":
+    main()
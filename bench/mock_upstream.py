@@ -0,0 +1,173 @@
+# Local stand-ins for the upstream endpoints, for offline benchmarks.
+#   sim-status server:  POST /api/v1/information/sim-status  (JSON, like tri.co.id)
+#   NIK/KK server:      POST /ceknomor/checkForm -> 302 + session cookie,
+#                       GET /ceknomor/result -> result HTML (like myim3)
+# Both also serve GET /sheet.csv?kind=sim|nik&rows=N, a generated spreadsheet
+# export for the /url paths. Lookups wait `latency` (+/- `jitter`) seconds and
+# fail with HTTP 500 or 429 at the given rates.
+# Usage: python bench/mock_upstream.py [--sim-port 8901] [--nik-port 8902]
+#            [--latency 0.05] [--jitter 0.02] [--error-rate 0] [--throttle-rate 0]
+# then start the bot with TRI_BASE_URL=http://127.0.0.1:8901 IM3_BASE_URL=http://127.0.0.1:8902
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+REASONS = {200: "OK", 302: "Found", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+           500: "Internal Server Error"}
+STATUSES = ("AKTIF", "TIDAK AKTIF", "TERBLOKIR")
+# Rows per chunk of a generated sheet
+SHEET_CHUNK_ROWS = 500
+
+# Result pages saved from the live site; the last digit of the NIK picks one
+def _load_pages():
+    pages = {}
+    for name in ("result_not_found", "result_one_number", "result_three_numbers"):
+        with open(os.path.join(FIXTURES, f"{name}.html"), encoding="utf-8") as file:
+            pages[name] = file.read().encode()
+    return pages
+
+class MockUpstream:
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, throttle_rate=0.0, retry_after=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.pages = _load_pages()
+        # checkForm session cookie -> NIK it was issued for
+        self.sessions = {}
+
+    # Function to answer one request: (status, headers, body or async chunk iterator)
+    async def route(self, method, path, query, headers, body):
+        if method == "GET" and path == "/sheet.csv":
+            return 200, {"Content-Type": "text/csv"}, self.sheet(query.get("kind", ["sim"])[0],
+                                                                 int(query.get("rows", ["1000"])[0]))
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        draw = random.random()
+        if draw < self.throttle_rate:
+            return 429, {"Retry-After": str(self.retry_after)}, b""
+        if draw < self.throttle_rate + self.error_rate:
+            return 500, {}, b"mock upstream error"
+
+        if method == "POST" and path == "/api/v1/information/sim-status":
+            return self.sim_status(json.loads(body or b"{}").get("msisdn", ""))
+        if method == "POST" and path == "/ceknomor/checkForm":
+            return self.check_form(parse_qs(body.decode()))
+        if method == "GET" and path == "/ceknomor/result":
+            return self.result(headers.get("cookie", ""))
+        return 404, {}, b"not found"
+
+    # Numbers ending in 7 are unknown, like a real share of pasted lists
+    def sim_status(self, msisdn):
+        if not msisdn.isdigit():
+            payload = {"status": False, "message": "MSISDN tidak valid"}
+        elif msisdn.endswith("7"):
+            payload = {"status": False, "message": "Nomor tidak terdaftar"}
+        else:
+            index = int(msisdn[-6:])
+            payload = {"status": True, "data": {"iccid": f"89621{msisdn[-12:]}", "cardStatus": STATUSES[index % 3],
+                                                "activationStatus": STATUSES[index % 2]}}
+        return 200, {"Content-Type": "application/json"}, json.dumps(payload).encode()
+
+    def check_form(self, form):
+        nik = form.get("nik", [""])[0]
+        if not nik or not form.get("kk"):
+            return 200, {"Content-Type": "text/html"}, self.pages["result_not_found"]
+        token = uuid.uuid4().hex
+        self.sessions[token] = nik
+        return 302, {"Location": "/ceknomor/result", "Set-Cookie": f"ci_session={token}; Path=/"}, b""
+
+    # The result page is only shown to the session checkForm issued
+    def result(self, cookie):
+        token = next((part.split("=", 1)[1] for part in cookie.split("; ") if part.startswith("ci_session=")), None)
+        nik = self.sessions.pop(token, None)
+        if nik is None:
+            return 302, {"Location": "/ceknomor/"}, b""
+        page = ("result_not_found", "result_one_number", "result_three_numbers")[int(nik[-1]) % 3]
+        return 200, {"Content-Type": "text/html"}, self.pages[page]
+
+    async def sheet(self, kind, rows):
+        yield (b"MSISDN\n" if kind == "sim" else b"NIK,KK\n")
+        for start in range(0, rows, SHEET_CHUNK_ROWS):
+            if kind == "sim":
+                lines = [f"0896{i:08d}\n" for i in range(start, min(rows, start + SHEET_CHUNK_ROWS))]
+            else:
+                lines = [f"3201{i:012d},3201{i + 500000:012d}\n" for i in range(start, min(rows, start + SHEET_CHUNK_ROWS))]
+            yield "".join(lines).encode()
+
+async def respond(writer, status, headers, body):
+    head = f"HTTP/1.1 {status} {REASONS[status]}\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    if isinstance(body, bytes):
+        writer.write(f"{head}Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    else:
+        writer.write(f"{head}Transfer-Encoding: chunked\r\n\r\n".encode())
+        async for chunk in body:
+            writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+# Function to serve one keep-alive connection
+async def handle_connection(upstream, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            method, target = request_line.decode("latin-1").split()[:2]
+            url = urlsplit(target)
+            status, response_headers, response_body = await upstream.route(method, url.path, parse_qs(url.query),
+                                                                            headers, body)
+            await respond(writer, status, response_headers, response_body)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+# Function to start one mock server; returns the asyncio server
+async def start_server(upstream, host, port):
+    server = await asyncio.start_server(lambda r, w: handle_connection(upstream, r, w), host, port)
+    logger.info(f"Mock upstream listening on {host}:{port}")
+    return server
+
+async def serve(args):
+    upstream = MockUpstream(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.retry_after)
+    # Separate ports, so each stand-in gets its own pool, rate limit and breaker like the real hosts
+    servers = [await start_server(upstream, args.host, args.sim_port),
+               await start_server(upstream, args.host, args.nik_port)]
+    print(f"TRI_BASE_URL=http://{args.host}:{args.sim_port} IM3_BASE_URL=http://{args.host}:{args.nik_port}", flush=True)
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the sim-status and checkForm upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--sim-port", type=int, default=8901)
+    parser.add_argument("--nik-port", type=int, default=8902)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every lookup")
+    parser.add_argument("--jitter", type=float, default=0.02, help="random +/- seconds on top of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of lookups answered with HTTP 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of lookups answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with a 429")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(serve(args))
+
+if __name__ == "__main__":
+    main()
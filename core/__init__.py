@@ -0,0 +1 @@
+# Shared upstream clients and bulk-processing helpers for the bot entry points
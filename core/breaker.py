@@ -0,0 +1,61 @@
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "tertutup"
+OPEN = "terbuka"
+HALF_OPEN = "setengah terbuka"
+
+class CircuitOpen(Exception):
+    pass
+
+# Per-upstream circuit breaker. After `threshold` consecutive failures it
+# opens and lookups fail fast; once `cooldown` has passed a single probe is
+# let through, and its outcome closes or re-opens the breaker.
+class CircuitBreaker:
+    def __init__(self, name, threshold, cooldown):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+
+    def check(self):
+        if self.state == CLOSED:
+            return
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            self._set_state(HALF_OPEN, "cooldown over, probing")
+        # A probe that never reported back (cancelled, re-queued) is replaced after a cooldown
+        now = time.monotonic()
+        if self.state == HALF_OPEN and (self._probe_started is None or now - self._probe_started >= self.cooldown):
+            self._probe_started = now
+            return
+        raise CircuitOpen(f"{self.name} tidak tersedia (circuit breaker {self.state})")
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_started = None
+        if self.state != CLOSED:
+            self._set_state(CLOSED, "probe succeeded")
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started = None
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+            self._opened_at = time.monotonic()
+            self.trips += 1
+            self._set_state(OPEN, f"{self.failures} consecutive failures")
+
+    def _set_state(self, state, reason):
+        logger.warning(f"Circuit breaker for {self.name}: {self.state} -> {state} ({reason})")
+        self.state = state
+
+# Function to get the delay before retry number `attempt` (1-based),
+# exponential with full jitter so retries from many rows spread out
+def retry_delay(attempt, base, cap):
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
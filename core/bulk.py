@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from collections import deque
+from functools import partial
+from core.breaker import CLOSED
+from core.cache import sim_cache
+from core.config import BULK_CONCURRENCY
+from core.normalize import check_msisdn, check_nik_pair, normalize_msisdn
+from core.results import NikRecord, SimRecord
+from core.upstream import breaker_states, check_sim_status, check_nik_kk
+
+logger = logging.getLogger(__name__)
+
+# Default per-row failures; the row's own input is filled in by for_input
+def failure_result(exc):
+    return SimRecord("", False, message=f"Error: {exc}")
+
+def nik_failure_result(exc):
+    return NikRecord("", "", False, message=f"Error: {exc}")
+
+# Row counts for one bulk job, used for the job summary. Given the spool of
+# a resumed job, the rows it already holds are counted and then skipped, and
+# their results seed the dedup map so later repeats are not looked up again.
+# A delta job passes its `carry` too, so rows reused from the earlier run
+# count as carried rather than unique.
+class BatchStats:
+    def __init__(self, spool=None, carry=None):
+        self.total = 0
+        self.unique = 0
+        self.rejected = 0
+        self.carried = 0
+        self.upstream_failures = 0
+        self.skip = 0
+        self.seen = {}
+        self._trips = {host: trips for host, (_, trips) in breaker_states().items()}
+        if spool is not None and spool.resumed:
+            self._resume(spool, carry)
+
+    # The batch check hands every row whose key is in `carry` the earlier
+    # result, so such a row in the spool was carried, not looked up
+    def _resume(self, spool, carry):
+        for record in spool.finished():
+            self.total += 1
+            key = record.key()
+            if record.rejected:
+                self.rejected += 1
+            elif carry is not None and key in carry:
+                self.carried += 1
+            elif key not in self.seen:
+                self.seen[key] = record
+                self.unique += 1
+            self.count(record)
+        self.skip = self.total
+
+    @property
+    def dedup_ratio(self):
+        checked = self.total - self.rejected - self.carried
+        return (checked - self.unique) / checked if checked else 0.0
+
+    def count(self, result):
+        if result.transient:
+            self.upstream_failures += 1
+
+    # Breakers that are not closed now, or that opened while this job ran
+    def breaker_notes(self):
+        return [f"circuit breaker {host} {state} (terbuka {trips - self._trips.get(host, 0)}x)"
+                for host, (state, trips) in breaker_states().items()
+                if state != CLOSED or trips > self._trips.get(host, 0)]
+
+    def summary(self):
+        parts = [f"{self.total} baris, {self.unique} unik (duplikat {self.dedup_ratio:.0%})"]
+        if self.carried:
+            parts.append(f"{self.carried} dibawa dari hasil sebelumnya")
+        if self.rejected:
+            parts.append(f"{self.rejected} ditolak karena format tidak valid")
+        if self.upstream_failures:
+            parts.append(f"{self.upstream_failures} gagal karena server tujuan")
+        parts.extend(self.breaker_notes())
+        return "; ".join(parts)
+
+# Function to iterate a plain list or an async stream of rows the same way
+async def aiterate(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+# Function to run func(*args) for every args tuple with at most `limit` calls in flight.
+# (args, result) pairs are yielded in input order; an exception only fails its own row.
+# Input may be an async stream, so lookups start while rows are still arriving.
+# With `key`, rows sharing a key are looked up once and the result is repeated for each row.
+# With `check`, every row is first passed through check(*args), which returns the
+# normalized args and either None or a record that is yielded as is: a rejection
+# or, for a delta re-check, an earlier result carried forward.
+async def iter_batch(func, args_iter, limit=None, on_error=failure_result, key=None, stats=None, check=None):
+    limit = limit or BULK_CONCURRENCY
+    slots = asyncio.Semaphore(limit)
+    stats = stats if stats is not None else BatchStats()
+    # A resumed job starts from the results its spool already holds
+    seen, stats.seen = stats.seen, {}
+
+    async def run_one(args):
+        async with slots:
+            try:
+                return await func(*args)
+            except Exception as e:
+                logger.error(f"Lookup {args} failed: {e}")
+                return on_error(e)
+
+    # Finished rows wait here until every earlier row is done; the window is
+    # capped so one slow row cannot make the buffer grow without bound
+    window = deque()
+    skip = stats.skip
+    try:
+        async for args in aiterate(args_iter):
+            # Rows a resumed job finished before the restart are already in its output
+            if skip:
+                skip -= 1
+                continue
+            stats.total += 1
+            answered = None
+            if check is not None:
+                args, answered = check(*args)
+            row_key = key(*args) if key and answered is None else None
+            task = seen.get(row_key) if row_key is not None else None
+            if answered is not None:
+                # Invalid and carried rows never reach the network; they keep their place in the output
+                if answered.rejected:
+                    stats.rejected += 1
+                else:
+                    stats.carried += 1
+                task = _finished(answered)
+            elif task is None:
+                stats.unique += 1
+                task = asyncio.ensure_future(run_one(args))
+                if key:
+                    seen[row_key] = task
+            elif not isinstance(task, asyncio.Future):
+                # A repeat of a row that was already handed over; `seen` holds its result
+                task = _finished(task)
+            window.append((args, task, row_key))
+            if len(window) >= limit * 4:
+                args, task, row_key = window.popleft()
+                yield args, _settle(seen, row_key, await task)
+            # Hand over rows that are already finished without waiting for more input
+            while window and window[0][1].done():
+                args, task, row_key = window.popleft()
+                yield args, _settle(seen, row_key, task.result())
+        while window:
+            args, task, row_key = window.popleft()
+            yield args, _settle(seen, row_key, await task)
+    finally:
+        for _, task, _ in window:
+            task.cancel()
+
+def _finished(result):
+    future = asyncio.get_running_loop().create_future()
+    future.set_result(result)
+    return future
+
+# Once a row is handed over, the dedup map keeps only its result rather than
+# the finished Task, which holds far more memory per row
+def _settle(seen, row_key, result):
+    if row_key is not None:
+        seen[row_key] = result
+    return result
+
+def sim_key(msisdn, use_cache=True):
+    return normalize_msisdn(msisdn)
+
+def nik_key(nik, kk):
+    return (nik.strip(), kk.strip())
+
+# Row checks for iter_batch. `carry` maps lookup keys to earlier results that
+# a delta re-check reuses instead of asking upstream again.
+def sim_check(msisdn, use_cache=True, carry=None):
+    msisdn, reason = check_msisdn(msisdn)
+    if reason is not None:
+        return (msisdn, use_cache), SimRecord(msisdn, False, message=reason, rejected=True)
+    return (msisdn, use_cache), carry.get(msisdn) if carry else None
+
+def nik_check(nik, kk, carry=None):
+    nik, kk, reason = check_nik_pair(nik, kk)
+    if reason is not None:
+        return (nik, kk), NikRecord(nik, kk, False, message=reason, rejected=True)
+    return (nik, kk), carry.get((nik, kk)) if carry else None
+
+# Function to check MSISDNs (a list or an async stream), yielding one record per input row
+async def iter_sim_records(msisdns, limit=None, use_cache=True, stats=None, carry=None):
+    stats = stats if stats is not None else BatchStats()
+    args_iter = ((msisdn, use_cache) async for msisdn in aiterate(msisdns))
+    async for (msisdn, _), result in iter_batch(check_sim_status, args_iter, limit, key=sim_key, stats=stats,
+                                                check=partial(sim_check, carry=carry)):
+        stats.count(result)
+        yield result.for_input(msisdn)
+    cache_stats = sim_cache.stats()
+    logger.info(f"SIM batch: {stats.summary()}; cache {cache_stats['hits']} hits, "
+                f"{cache_stats['misses']} misses, {cache_stats['size']} entries")
+
+# Function to check (NIK, KK) pairs (a list or an async stream), yielding one record per input row
+async def iter_nik_records(pairs, limit=None, stats=None, carry=None):
+    stats = stats if stats is not None else BatchStats()
+    async for (nik, kk), result in iter_batch(check_nik_kk, pairs, limit, nik_failure_result, nik_key, stats,
+                                              partial(nik_check, carry=carry)):
+        stats.count(result)
+        yield result.for_input(nik, kk)
+    logger.info(f"NIK/KK batch: {stats.summary()}")
+
+# Function to collect the records of an MSISDN batch
+async def check_sim_batch(msisdns, limit=None, use_cache=True, stats=None):
+    return [record async for record in iter_sim_records(msisdns, limit, use_cache, stats)]
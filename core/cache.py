@@ -0,0 +1,91 @@
+import logging
+import time
+from collections import OrderedDict
+from core.config import SIM_CACHE_TTL, SIM_CACHE_NEGATIVE_TTL, SIM_CACHE_SIZE, SIM_CACHE_PATH, STATE_BACKEND
+from core.results import SimRecord
+from core.state import SqliteState, shared_state
+
+logger = logging.getLogger(__name__)
+
+# LRU cache of lookup results with separate TTLs for successes and failures.
+# With a shared state backend every result is also written there, and a local
+# miss checks it, so one worker's lookups are reused by the others. With
+# `path` the results go to a SQLite file of the cache's own instead, so they
+# survive a restart while everything else stays in memory.
+# Results are records of `record_type`, stored in the backend as JSON lists.
+class ResultCache:
+    def __init__(self, ttl, negative_ttl, max_size, namespace, record_type, shared=False, path=""):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.namespace = namespace
+        self.record_type = record_type
+        # Results are written through to a backend when it outlives this process
+        self.write_through = shared or bool(path)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._db = None
+
+    # Function to get the backend results are written through to
+    def _store(self):
+        if not self.path:
+            return shared_state()
+        if self._db is None:
+            self._db = SqliteState(self.path)
+        return self._db
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= time.time():
+            del self._entries[key]
+            entry = None
+        if entry is None and self.write_through:
+            stored = await self._store().get(self.namespace, key)
+            if stored is not None and stored[1] > time.time():
+                entry = (self.record_type.from_json(stored[0]), stored[1])
+                self._remember(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def set(self, key, result):
+        ttl = self.ttl if result.status else self.negative_ttl
+        if ttl <= 0:
+            return
+        entry = (result, time.time() + ttl)
+        self._remember(key, entry)
+        if self.write_through:
+            await self._store().set(self.namespace, key, [result.to_json(), entry[1]], ttl=ttl)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Process-wide cache for check_sim_status, keyed by normalized MSISDN
+sim_cache = ResultCache(SIM_CACHE_TTL, SIM_CACHE_NEGATIVE_TTL, SIM_CACHE_SIZE, "sim", SimRecord,
+                         shared=STATE_BACKEND != "memory", path=SIM_CACHE_PATH)
+
+# Function to close the SIM cache's own SQLite file, used on shutdown
+async def close_cache(application=None):
+    await sim_cache.close()
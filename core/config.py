@@ -0,0 +1,102 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+# Entry points import core before calling load_dotenv themselves
+load_dotenv()
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+def env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+# Upstream base URLs (scheme and host, no trailing path); bench/mock_upstream.py
+# serves the same endpoints locally for offline benchmarks
+TRI_BASE_URL = os.getenv("TRI_BASE_URL", "https://tri.co.id").rstrip("/")
+IM3_BASE_URL = os.getenv("IM3_BASE_URL", "https://myim3.indosatooredoo.com").rstrip("/")
+# Connections kept open per upstream host (tri.co.id, myim3, docs.google.com)
+UPSTREAM_POOL_SIZE = env_int("UPSTREAM_POOL_SIZE", 20)
+# Idle keep-alive connections are dropped after this many seconds
+UPSTREAM_KEEPALIVE_EXPIRY = env_float("UPSTREAM_KEEPALIVE_EXPIRY", 60.0)
+UPSTREAM_TIMEOUT = env_float("UPSTREAM_TIMEOUT", 10.0)
+# Lookups a single bulk job keeps in flight
+BULK_CONCURRENCY = env_int("BULK_CONCURRENCY", 8)
+# Requests in flight to one upstream host, shared by every job in the process
+UPSTREAM_HOST_CONCURRENCY = env_int("UPSTREAM_HOST_CONCURRENCY", 10)
+# SIM status cache: successful lookups live SIM_CACHE_TTL seconds, failures SIM_CACHE_NEGATIVE_TTL
+SIM_CACHE_TTL = env_float("SIM_CACHE_TTL", 3600.0)
+SIM_CACHE_NEGATIVE_TTL = env_float("SIM_CACHE_NEGATIVE_TTL", 60.0)
+SIM_CACHE_SIZE = env_int("SIM_CACHE_SIZE", 50000)
+# SQLite file of its own that keeps the SIM cache across restarts, without
+# moving sessions and jobs to a shared STATE_BACKEND; empty uses STATE_BACKEND
+SIM_CACHE_PATH = os.getenv("SIM_CACHE_PATH", "")
+# Name of this bot, by default the script it runs as (newbot, botlengkap,
+# statusbot). Job types, job queues, job records and sessions are kept under
+# it, so bots sharing JOB_DIR and the state backend only see their own.
+APP_NAME = os.getenv("APP_NAME") or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "bot"
+# Directory for per-job result spools
+JOB_DIR = os.getenv("JOB_DIR", "jobs")
+# Directory for rendered result files, each removed once it has been sent
+OUTPUT_DIR = os.getenv("OUTPUT_DIR", os.path.join(JOB_DIR, "output"))
+# Seconds between progress message edits for a bulk job
+PROGRESS_INTERVAL = env_float("PROGRESS_INTERVAL", 5.0)
+# Send a partial results file every N finished rows (0 = only on request)
+PROGRESS_PARTIAL_EVERY = env_int("PROGRESS_PARTIAL_EVERY", 0)
+# Number of bulk jobs processed at the same time
+JOB_WORKERS = env_int("JOB_WORKERS", 2)
+# Seconds a job record is kept for /status after it was last updated
+JOB_RECORD_TTL = env_float("JOB_RECORD_TTL", 7 * 86400.0)
+# Seconds between checks of the shared job queue and of cancel requests
+JOB_POLL_INTERVAL = env_float("JOB_POLL_INTERVAL", 1.0)
+# Directory for checkpoints of running jobs, resumed when the bot restarts
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", os.path.join(JOB_DIR, "checkpoints"))
+# Seconds between flushes of a job's spool, which is also its row checkpoint
+CHECKPOINT_INTERVAL = env_float("CHECKPOINT_INTERVAL", 2.0)
+# Starting and maximum request rate per upstream host (requests/second)
+UPSTREAM_RATE = env_float("UPSTREAM_RATE", 10.0)
+# Floor the rate drops to while an upstream keeps throttling
+UPSTREAM_MIN_RATE = env_float("UPSTREAM_MIN_RATE", 0.5)
+# Requests/second won back after each successful request
+UPSTREAM_RATE_RECOVERY = env_float("UPSTREAM_RATE_RECOVERY", 0.05)
+# Times a throttled lookup is re-queued before it is reported as failed
+THROTTLE_REQUEUE_LIMIT = env_int("THROTTLE_REQUEUE_LIMIT", 10)
+# Extra attempts for a lookup that failed with a transient error
+UPSTREAM_RETRIES = env_int("UPSTREAM_RETRIES", 3)
+# Base and maximum delay (seconds) of the jittered exponential retry backoff
+RETRY_BASE_DELAY = env_float("RETRY_BASE_DELAY", 0.5)
+RETRY_MAX_DELAY = env_float("RETRY_MAX_DELAY", 10.0)
+# Consecutive upstream failures that open the circuit breaker
+BREAKER_FAILURES = env_int("BREAKER_FAILURES", 5)
+# Seconds the breaker stays open before letting a probe request through
+BREAKER_COOLDOWN = env_float("BREAKER_COOLDOWN", 30.0)
+# "webhook" serves updates over HTTP; anything else uses long polling
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+# Public base URL Telegram posts updates to (e.g. the load balancer address)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()
+# Local address, port and path the webhook listener binds to
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = env_int("WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram").strip("/")
+# Optional secret Telegram must echo in X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Where sessions, job records and cached results live: memory, sqlite or http
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").strip().lower()
+# SQLite file for STATE_BACKEND=sqlite, shared by workers on one host
+STATE_PATH = os.getenv("STATE_PATH", "state.db")
+# Address of `python -m core.kvserver` for STATE_BACKEND=http
+STATE_URL = os.getenv("STATE_URL", "http://127.0.0.1:8765")
+# Seconds a user's pending input and finished job files are remembered
+SESSION_TTL = env_float("SESSION_TTL", 86400.0)
+# Largest session one user may keep, in bytes of serialized JSON
+SESSION_MAX_BYTES = env_int("SESSION_MAX_BYTES", 2 * 1024 * 1024)
+# Compressed session bytes kept in memory before the least recently used spill to disk
+SESSION_MEMORY_BUDGET = env_int("SESSION_MEMORY_BUDGET", 32 * 1024 * 1024)
+# Directory for spilled sessions
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", os.path.join(JOB_DIR, "sessions"))
+# Delta re-checks reuse an earlier successful answer younger than this many seconds
+DELTA_MAX_AGE = env_float("DELTA_MAX_AGE", 3 * 86400.0)
+# Largest uploaded CSV/XLSX accepted as bulk input (bots can download at most 20 MB)
+UPLOAD_MAX_BYTES = env_int("UPLOAD_MAX_BYTES", 20 * 1024 * 1024)
@@ -0,0 +1,132 @@
+import logging
+import os
+import time
+import uuid
+from core.config import DELTA_MAX_AGE, JOB_DIR
+from core.jobs import bulk_jobs
+from core.normalize import check_msisdn, check_nik_pair
+from core.results import FROM_ROW, RecordColumns
+from core.uploads import READERS
+from core.writers import read_spool
+
+logger = logging.getLogger(__name__)
+
+# Delta re-checks: rows answered recently in an earlier result (a finished
+# job's spool or an exported CSV/XLSX file) are carried forward with their
+# original check time; only new rows, failures and stale answers are looked up.
+
+class DeltaError(ValueError):
+    pass
+
+# Function to describe the earlier result a command points at: a job ID
+# argument, or the result file the command message replies to
+def previous_source(message, job_id=None):
+    if job_id:
+        return {"job_id": job_id}
+    replied = message.reply_to_message
+    if replied is not None and replied.document is not None:
+        # The reply's date stands in for the check time in files without a "Checked At" column
+        return {"file_id": replied.document.file_id, "file_name": replied.document.file_name or "",
+                "checked_at": replied.date.timestamp()}
+    return None
+
+# Function to tell whether an earlier result may be reused as is
+def reusable(record, now, max_age=DELTA_MAX_AGE):
+    return record.status and not record.transient and not record.rejected and now - record.checked_at <= max_age
+
+# Reusable earlier results by lookup key, for iter_*_records(carry=...). A
+# previous job can be as large as the new one, so the records are held in
+# RecordColumns and only the key -> row index map is a dict.
+class CarriedResults:
+    def __init__(self, kind):
+        self._records = RecordColumns(kind)
+        self._index = {}
+
+    def add(self, key, record):
+        self._index[key] = len(self._records)
+        self._records.append(record)
+
+    def get(self, key):
+        index = self._index.get(key)
+        return None if index is None else self._records[index]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+# Function to read an exported CSV/XLSX result back into records. Reading
+# stops at the first blank row, where the "Ditolak" section starts.
+def read_result_file(path, kind, checked_at):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise DeltaError("File hasil sebelumnya harus berupa CSV atau XLSX.")
+    columns, from_row = FROM_ROW[kind]
+    rows = READERS[extension](path)
+    header = next(rows, None)
+    if header is None or [cell.strip() for cell in header[:2]] != columns[:2]:
+        rows.close()
+        raise DeltaError("File yang dibalas bukan file hasil pemeriksaan yang sesuai.")
+    for row in rows:
+        if not any(cell.strip() for cell in row):
+            break
+        yield from_row(row, checked_at)
+    rows.close()
+
+# Lookup key of a record under the same normalization the batch applies, or None if invalid
+def _key(record):
+    if hasattr(record, "msisdn"):
+        msisdn, reason = check_msisdn(record.msisdn)
+        return None if reason else msisdn
+    nik, kk, reason = check_nik_pair(record.nik, record.kk)
+    return None if reason else (nik, kk)
+
+async def _download(bot, previous):
+    os.makedirs(JOB_DIR, exist_ok=True)
+    path = os.path.join(JOB_DIR, f"previous_{uuid.uuid4().hex}{os.path.splitext(previous['file_name'])[1].lower()}")
+    telegram_file = await bot.get_file(previous["file_id"])
+    await telegram_file.download_to_drive(path)
+    return path
+
+# Function to index the reusable results of an earlier run by lookup key,
+# for iter_sim_records / iter_nik_records(carry=...). Only reusable records
+# are kept, the earlier result itself is streamed.
+async def load_previous(previous, kind, bot, user_id):
+    path = None
+    if "job_id" in previous:
+        record = await bulk_jobs.get(previous["job_id"])
+        if (record is None or record["user_id"] != user_id or record.get("kind") != kind
+                or not record.get("spool") or not os.path.exists(record["spool"])):
+            raise DeltaError(f"Hasil job {previous['job_id']} tidak ditemukan atau sudah tidak tersedia.")
+        records = read_spool(record["spool"], kind)
+    else:
+        path = await _download(bot, previous)
+        records = read_result_file(path, kind, previous["checked_at"])
+
+    now = time.time()
+    carry = CarriedResults(kind)
+    try:
+        for record in records:
+            key = _key(record)
+            # A key repeated in the earlier result keeps its first reusable answer
+            if key is not None and key not in carry and reusable(record, now):
+                carry.add(key, record.for_input(*key) if kind == "nik" else record.for_input(key))
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+    logger.info(f"Delta re-check for user {user_id}: {len(carry)} earlier results reusable")
+    return carry
+
+# Function to load the earlier results of a delta job (job.params["previous"]).
+# Returns (carry, status text for the job's progress message); carry is None
+# for a normal run. A DeltaError is reported to the chat before it fails the job.
+async def load_delta(job, bot, kind):
+    if not job.params.get("previous"):
+        return None, f"Job {job.id}: sedang memproses..."
+    try:
+        carry = await load_previous(job.params["previous"], kind, bot, job.user_id)
+    except DeltaError as e:
+        await bot.send_message(job.chat_id, f"Job {job.id}: {e}")
+        raise
+    return carry, f"Job {job.id}: mode delta, {len(carry)} hasil sebelumnya masih berlaku.\nSedang memproses..."
@@ -0,0 +1,69 @@
+from html.parser import HTMLParser
+
+# Class attribute of the <ul> holding the registered numbers on the myim3 result page
+RESULT_LIST_CLASS = "list-unstyled margin-5-top"
+
+class _Done(Exception):
+    pass
+
+# Collects only the first <h6> and the <li> texts of the first result list,
+# then stops so the rest of the page (footer, scripts) is never tokenized
+class _ResultPageParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.nik = None
+        self.nomor = None
+        self._h6_depth = 0
+        self._h6_parts = []
+        self._ul_depth = 0
+        self._open_items = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.nik is None and tag == "h6":
+            self._h6_depth += 1
+        if self.nomor is None:
+            if self._ul_depth:
+                if tag == "ul":
+                    self._ul_depth += 1
+                elif tag == "li":
+                    self._open_items.append(len(self._items))
+                    self._items.append([])
+            elif tag == "ul" and " ".join((dict(attrs).get("class") or "").split()) == RESULT_LIST_CLASS:
+                self._ul_depth = 1
+                self._items = []
+
+    def handle_endtag(self, tag):
+        if self._h6_depth and tag == "h6":
+            self._h6_depth -= 1
+            if not self._h6_depth:
+                self.nik = "".join(self._h6_parts).strip()
+        if self._ul_depth:
+            if tag == "li" and self._open_items:
+                self._open_items.pop()
+            elif tag == "ul":
+                self._ul_depth -= 1
+                if not self._ul_depth:
+                    self.nomor = ["".join(parts).strip() for parts in self._items]
+                    self._open_items = []
+        if self.nik is not None and self.nomor is not None:
+            raise _Done
+
+    def handle_data(self, data):
+        if self._h6_depth:
+            self._h6_parts.append(data)
+        # Nested items also count towards their parents' text, as with Tag.text
+        for index in self._open_items:
+            self._items[index].append(data)
+
+# Function to pull the NIK heading and registered numbers out of a result page.
+# Returns (nik, nomor) or None when either element is missing.
+def extract_nik_result(html):
+    parser = _ResultPageParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except _Done:
+        pass
+    if parser.nik is None or parser.nomor is None:
+        return None
+    return parser.nik, parser.nomor
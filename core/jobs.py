@@ -0,0 +1,368 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from core.config import APP_NAME, CHECKPOINT_DIR, JOB_DIR, JOB_RECORD_TTL, JOB_WORKERS, JOB_POLL_INTERVAL, OUTPUT_DIR
+from core.scheduler import current_user
+from core.state import app_namespace, shared_state
+from core.upstream import lookup_depth
+from core.writers import discard_spool
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "antre"
+RUNNING = "berjalan"
+DONE = "selesai"
+FAILED = "gagal"
+CANCELLED = "dibatalkan"
+
+# State namespaces for job records and cancel flags. Queues need no scope of
+# their own: they are named after job types, which already carry APP_NAME.
+JOB_NS = app_namespace("job")
+CANCEL_NS = app_namespace("cancel")
+
+# Job runners by type name. A runner is `async def run(job, bot)`; it may only
+# rely on the job record (params, chat, user), so any worker can run it.
+# Names are scoped to APP_NAME: bots register runners under the same short
+# name (upload, ceknik_sheet) that do different things.
+JOB_TYPES = {}
+
+# Function to scope a short job type name to this bot
+def scoped_type(name):
+    return f"{APP_NAME}:{name}"
+
+# Decorator to register a job runner under a type name
+def job_type(name):
+    def register(func):
+        JOB_TYPES[scoped_type(name)] = func
+        return func
+    return register
+
+# One bulk submission. The record (everything but `progress` and `task`) lives
+# in the shared state backend, so every worker can report on and cancel it.
+class Job:
+    FIELDS = ("id", "type", "user_id", "chat_id", "description", "params", "state", "error",
+              "summary", "progress_text", "spool", "kind", "output_format", "worker", "created_at")
+
+    def __init__(self, type, user_id, chat_id, description, params):
+        self.id = uuid.uuid4().hex[:8]
+        self.type = type
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.description = description
+        self.params = params
+        self.state = QUEUED
+        self.error = None
+        self.summary = None
+        self.progress_text = None
+        self.spool = None
+        self.kind = None
+        self.output_format = None
+        self.worker = None
+        self.created_at = time.time()
+        self.progress = None
+        self.task = None
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls.__new__(cls)
+        for field in cls.FIELDS:
+            setattr(job, field, record.get(field))
+        job.progress = None
+        job.task = None
+        return job
+
+    def to_record(self):
+        if self.progress is not None:
+            self.progress_text = self.progress.text()
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+def finished(record):
+    return record["state"] in (DONE, FAILED, CANCELLED)
+
+# Running jobs are also checkpointed to CHECKPOINT_DIR on local disk: the job
+# record here, its finished rows in its spool. A job interrupted by a restart
+# keeps both and is queued again by the next process that starts on this host.
+def _checkpoint_path(job_id):
+    return os.path.join(CHECKPOINT_DIR, f"{job_id}.json")
+
+def save_checkpoint(record):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = _checkpoint_path(record["id"])
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(record, file)
+    os.replace(path + ".tmp", path)
+
+def drop_checkpoint(job_id):
+    try:
+        os.remove(_checkpoint_path(job_id))
+    except FileNotFoundError:
+        pass
+
+def _alive(worker):
+    host, _, pid = worker.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# Function to remove job spools (finished rows kept for other output formats
+# and delta re-checks) once they outlive the job records pointing at them,
+# and result files left in OUTPUT_DIR by a send that never finished
+def sweep_spools(max_age=JOB_RECORD_TTL):
+    cutoff = time.time() - max_age
+    if os.path.isdir(JOB_DIR):
+        for name in os.listdir(JOB_DIR):
+            path = os.path.join(JOB_DIR, name)
+            if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+    if os.path.isdir(OUTPUT_DIR):
+        for name in os.listdir(OUTPUT_DIR):
+            path = os.path.join(OUTPUT_DIR, name)
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+# Function to take over the checkpoints of the given job types left by
+# workers that are no longer running. A checkpoint carrying our own worker ID
+# is from an earlier process (a restarted container keeps its hostname and
+# PID). Other types belong to another bot sharing the directory and are left
+# alone. Each file is claimed by renaming it, so of several processes
+# starting at once only one resumes a given job.
+def claim_checkpoints(worker_id, types):
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return []
+    records = []
+    for name in sorted(os.listdir(CHECKPOINT_DIR)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(CHECKPOINT_DIR, name)
+        try:
+            with open(path, encoding="utf-8") as file:
+                record = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if record.get("type") not in types:
+            continue
+        if record.get("worker") and record["worker"] != worker_id and _alive(record["worker"]):
+            continue
+        claimed = f"{path}.{os.getpid()}"
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            continue
+        record["worker"] = worker_id
+        save_checkpoint(record)
+        os.remove(claimed)
+        records.append(record)
+    return records
+
+# Bulk job queue kept in the shared state backend (one FIFO per job type) and
+# served by JOB_WORKERS worker tasks in every bot process, so handlers only
+# submit work and several processes can split the queue
+class BulkJobQueue:
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._bot = None
+        self._wakeup = None
+        self._worker_tasks = []
+        self._checkpointed = {}
+        self._swept_at = 0
+
+    async def start(self, application=None):
+        self._bot = application.bot if application is not None else None
+        self._wakeup = asyncio.Event()
+        await self._resume()
+        self._worker_tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(f"Started {self.workers} bulk job workers on {self.worker_id} for {', '.join(JOB_TYPES)}")
+
+    # Queue again the jobs a previous process was running when it stopped
+    async def _resume(self):
+        for record in claim_checkpoints(self.worker_id, JOB_TYPES):
+            if await shared_state().get(CANCEL_NS, record["id"]):
+                drop_checkpoint(record["id"])
+                discard_spool(record.get("spool"))
+                continue
+            job = Job.from_record(record)
+            job.state, job.worker = QUEUED, None
+            await self.save(job)
+            await shared_state().push(f"jobs:{job.type}", job.id)
+            logger.info(f"Job {job.id} resumed from checkpoint for user {job.user_id}")
+            if self._bot is not None:
+                await self._bot.send_message(job.chat_id, f"Bot dimulai ulang. Job {job.id} dilanjutkan dari checkpoint.")
+
+    async def stop(self, application=None):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def save(self, job):
+        record = job.to_record()
+        await shared_state().set(JOB_NS, job.id, record, ttl=JOB_RECORD_TTL)
+        # The checkpoint only changes when the job starts and when it opens its spool
+        if job.state == RUNNING and job.worker == self.worker_id and self._checkpointed.get(job.id, "") != job.spool:
+            save_checkpoint(record)
+            self._checkpointed[job.id] = job.spool
+
+    async def submit(self, job):
+        await self.save(job)
+        await shared_state().push(f"jobs:{job.type}", job.id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"Job {job.id} queued for user {job.user_id}: {job.description}")
+        return job
+
+    async def get(self, job_id):
+        return await shared_state().get(JOB_NS, job_id)
+
+    async def user_jobs(self, user_id):
+        records = [record for record in await shared_state().values(JOB_NS) if record["user_id"] == user_id]
+        return sorted(records, key=lambda record: record["created_at"])
+
+    async def position(self, record):
+        queued = [other for other in await shared_state().values(JOB_NS)
+                  if other["state"] == QUEUED and other["type"] == record["type"]
+                  and other["created_at"] <= record["created_at"]]
+        return len(queued)
+
+    async def cancel(self, record):
+        if finished(record):
+            return False
+        # Whichever worker holds the job sees the flag on its next poll
+        await shared_state().set(CANCEL_NS, record["id"], True, ttl=JOB_RECORD_TTL)
+        if record["state"] == QUEUED:
+            record["state"] = CANCELLED
+            await shared_state().set(JOB_NS, record["id"], record, ttl=JOB_RECORD_TTL)
+        logger.info(f"Job {record['id']} cancel requested while {record['state']}")
+        return True
+
+    async def _claim(self):
+        for name in JOB_TYPES:
+            job_id = await shared_state().pop(f"jobs:{name}")
+            if job_id is None:
+                continue
+            record = await self.get(job_id)
+            if record is None or await shared_state().get(CANCEL_NS, job_id):
+                continue
+            return Job.from_record(record)
+        return None
+
+    async def _worker(self, number):
+        while True:
+            job = await self._claim()
+            if job is None:
+                # Woken at once by local submissions, otherwise poll for other workers' jobs
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job.state, job.worker = RUNNING, self.worker_id
+            await self.save(job)
+            started_at = time.monotonic()
+            # Lookups made by the job are scheduled fairly under its owner
+            current_user.set(job.user_id)
+            job.task = asyncio.create_task(JOB_TYPES[job.type](job, self._bot))
+            watcher = asyncio.create_task(self._watch(job))
+            try:
+                await job.task
+                job.state = DONE
+            except asyncio.CancelledError:
+                if not await shared_state().get(CANCEL_NS, job.id):
+                    raise
+                job.state = CANCELLED
+            except Exception as e:
+                job.state, job.error = FAILED, str(e)
+                logger.error(f"Job {job.id} failed: {e}")
+            finally:
+                watcher.cancel()
+            await self.save(job)
+            # A failed or cancelled job leaves nothing to resume or re-render
+            drop_checkpoint(job.id)
+            self._checkpointed.pop(job.id, None)
+            if job.state != DONE:
+                discard_spool(job.spool)
+            if time.time() - self._swept_at >= 3600:
+                sweep_spools()
+                self._swept_at = time.time()
+            logger.info(f"Job {job.id} {job.state} on worker {number} after {time.monotonic() - started_at:.1f}s")
+
+    # Publish progress for /status on other workers and pick up cancel requests
+    async def _watch(self, job):
+        while True:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            if await shared_state().get(CANCEL_NS, job.id):
+                job.task.cancel()
+                return
+            await self.save(job)
+
+    async def describe(self, record):
+        lines = [f"Job {record['id']} ({record['description']}): {record['state']}"]
+        if record["state"] == QUEUED:
+            lines.append(f"Posisi antrean: {await self.position(record)}")
+        elif record["state"] == RUNNING:
+            if record.get("progress_text"):
+                lines.append(record["progress_text"])
+            if record["worker"] == self.worker_id:
+                for host, (waiting, active) in lookup_depth(record["user_id"]).items():
+                    if waiting or active:
+                        lines.append(f"{host}: {active} lookup berjalan, {waiting} menunggu")
+        elif record["state"] == DONE and record.get("summary"):
+            lines.append(record["summary"])
+        elif record["state"] == FAILED:
+            lines.append(f"Kesalahan: {record['error']}")
+        return "\n".join(lines)
+
+bulk_jobs = BulkJobQueue()
+
+# Command handler for /status [id]
+async def job_status(update, context):
+    user_id = update.effective_user.id
+    if context.args:
+        record = await bulk_jobs.get(context.args[0])
+        if record is None or record["user_id"] != user_id:
+            await update.message.reply_text("Job tidak ditemukan.")
+            return
+        await update.message.reply_text(await bulk_jobs.describe(record))
+        return
+
+    records = await bulk_jobs.user_jobs(user_id)
+    if not records:
+        await update.message.reply_text("Anda tidak memiliki job.")
+        return
+    await update.message.reply_text("\n\n".join([await bulk_jobs.describe(record) for record in records[-10:]]))
+
+# Command handler for /cancel <id>
+async def job_cancel(update, context):
+    if not context.args:
+        await update.message.reply_text("Gunakan: /cancel <ID job>")
+        return
+    record = await bulk_jobs.get(context.args[0])
+    if record is None or record["user_id"] != update.effective_user.id:
+        await update.message.reply_text("Job tidak ditemukan.")
+        return
+    if await bulk_jobs.cancel(record):
+        await update.message.reply_text(f"Job {record['id']} dibatalkan.")
+    else:
+        await update.message.reply_text(f"Job {record['id']} sudah {record['state']}.")
+
+# Function to queue a bulk job of a registered type and tell the user its ID
+async def submit_job(message, user_id, description, type, params):
+    job = await bulk_jobs.submit(Job(scoped_type(type), user_id, message.chat_id, description, params))
+    position = await bulk_jobs.position(job.to_record())
+    await message.reply_text(
+        f"Job {job.id} masuk antrean (posisi {position}).\n"
+        f"Gunakan /status {job.id} untuk melihat progres atau /cancel {job.id} untuk membatalkan."
+    )
+    return job
@@ -0,0 +1,74 @@
+# Minimal network key-value server backing STATE_BACKEND=http, so bot workers
+# on different hosts can share sessions, job records, cached results and the
+# job queue. Stand-in for a real shared store; not meant to face the internet.
+# Usage: python -m core.kvserver [--host 127.0.0.1] [--port 8765] [--path state.db]
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.state import MemoryState, SqliteState
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("get", "set", "delete", "values", "push", "pop")
+
+async def respond(writer, status, body):
+    payload = json.dumps(body).encode()
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}[status]
+    writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+    await writer.drain()
+
+# Function to serve one keep-alive connection: POST /<method> with JSON params
+async def handle_connection(state, reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            method = request_line.decode("latin-1").split()[1].strip("/")
+            if method not in METHODS:
+                await respond(writer, 404, {"error": f"unknown method {method}"})
+                continue
+            try:
+                value = await getattr(state, method)(**json.loads(body or b"{}"))
+            except (TypeError, ValueError) as e:
+                await respond(writer, 400, {"error": str(e)})
+                continue
+            await respond(writer, 200, {"value": value})
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port, path):
+    state = SqliteState(path) if path else MemoryState()
+    server = await asyncio.start_server(lambda r, w: handle_connection(state, r, w), host, port)
+    logger.info(f"Shared state server listening on {host}:{port} ({path or 'in memory'})")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared state server for bot workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="", help="SQLite file; empty keeps state in memory")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(serve(args.host, args.port, args.path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Function to read the current resident set size in MiB (None when unavailable)
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current RSS; reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Function to log how long imports took and the RSS right before polling starts
+def log_startup(started_at):
+    elapsed = time.perf_counter() - started_at
+    rss = current_rss_mb()
+    rss_text = f"{rss:.1f} MiB" if rss is not None else "unknown"
+    logger.info(f"Startup: imports and setup took {elapsed * 1000:.0f} ms, RSS {rss_text}")
@@ -0,0 +1,62 @@
+import re
+
+# Separators people paste inside numbers ("0896-1234 5678", "(0896) 1234.5678")
+_SEPARATORS = str.maketrans("", "", " \t\r\n-.()")
+
+# Indonesian mobile numbers in the "628..." form: 10 to 14 digits in all
+_MSISDN_PATTERN = re.compile(r"628\d{7,11}")
+_ID_PATTERN = re.compile(r"\d{16}")
+
+# Function to rewrite a pasted MSISDN ("0896...", "+62 896-...", "896...")
+# into the "62896..." form upstream expects
+def normalize_msisdn(msisdn):
+    msisdn = msisdn.translate(_SEPARATORS)
+    if msisdn.startswith("+"):
+        msisdn = msisdn[1:]
+    if msisdn.startswith("0"):
+        msisdn = "62" + msisdn[1:]
+    elif msisdn.startswith("8"):
+        msisdn = "62" + msisdn
+    return msisdn
+
+# Function to normalize one MSISDN and say why it cannot be looked up.
+# Returns (msisdn, None) for a valid number, otherwise (input, reason).
+def check_msisdn(msisdn):
+    normalized = normalize_msisdn(msisdn)
+    if not normalized:
+        return msisdn, "Nomor kosong"
+    if not normalized.isdigit():
+        return msisdn, "Nomor hanya boleh berisi angka"
+    if not normalized.startswith("628"):
+        return msisdn, "Nomor harus diawali 08, 628 atau +628"
+    if not _MSISDN_PATTERN.fullmatch(normalized):
+        return msisdn, f"Panjang nomor tidak valid ({len(normalized)} digit)"
+    return normalized, None
+
+# Function to normalize a NIK or KK, which must be exactly 16 digits.
+# Sheets may prefix text cells with an apostrophe.
+def normalize_id(value):
+    return value.translate(_SEPARATORS).lstrip("'")
+
+# Function to normalize a NIK or KK and say why it is not usable.
+# Returns (value, None) when valid, otherwise (input, reason).
+def check_id(value, name="NIK"):
+    normalized = normalize_id(value)
+    if not _ID_PATTERN.fullmatch(normalized):
+        return value, f"{name} harus 16 digit angka"
+    return normalized, None
+
+# Function to normalize one (NIK, KK) pair and say why it cannot be looked up.
+# Returns (nik, kk, None) for a valid pair, otherwise the input and a reason.
+def check_nik_pair(nik, kk):
+    normalized_nik, nik_problem = check_id(nik, "NIK")
+    normalized_kk, kk_problem = check_id(kk, "KK")
+    problems = [problem for problem in (nik_problem, kk_problem) if problem]
+    if problems:
+        return nik, kk, ", ".join(problems)
+    return normalized_nik, normalized_kk, None
+
+# Function to read MSISDNs from a pasted message, one per line. Blank lines
+# are dropped; everything else is normalized and validated by the batch.
+def msisdns_from_text(text_data):
+    return [line for line in text_data.strip().split("\n") if line.strip()]
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import time
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from core.config import PROGRESS_INTERVAL, PROGRESS_PARTIAL_EVERY
+from core.jobs import CANCEL_NS, RUNNING, bulk_jobs
+from core.state import shared_state
+
+logger = logging.getLogger(__name__)
+
+# Live progress for one bulk job. Lookups only bump a counter; a background
+# ticker edits the Telegram message at most once per PROGRESS_INTERVAL, so
+# updates are coalesced and never hold up the lookup loop.
+class JobProgress:
+    def __init__(self, message, kind, output_format, spool=None, total=None, job_id=None):
+        self.job_id = job_id
+        self.message = message
+        self.kind = kind
+        self.output_format = output_format
+        self.spool = spool
+        self.total = total
+        self.done = 0
+        self.started_at = time.monotonic()
+        self._last_text = None
+        self._last_partial = 0
+        self._ticker = None
+
+    def advance(self, count=1):
+        self.done += count
+
+    def text(self):
+        elapsed = time.monotonic() - self.started_at
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        lines = ["Sedang memproses..."]
+        if self.total:
+            lines.append(f"Selesai: {self.done}/{self.total} baris")
+        else:
+            lines.append(f"Selesai: {self.done} baris")
+        lines.append(f"Kecepatan: {rate:.1f} baris/detik")
+        if self.total and rate > 0:
+            lines.append(f"Perkiraan selesai: {(self.total - self.done) / rate:.0f} detik lagi")
+        return "\n".join(lines)
+
+    def keyboard(self):
+        if self.spool is None or self.job_id is None:
+            return None
+        return InlineKeyboardMarkup([[InlineKeyboardButton("Kirim hasil sementara", callback_data=f"partial:{self.job_id}")]])
+
+    async def start(self):
+        await self._edit(self.text(), self.keyboard())
+        self._ticker = asyncio.create_task(self._tick())
+
+    # A failed edit or partial send is logged and retried on a later tick;
+    # it must not end the ticker for the rest of the job
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try:
+                await self._edit(self.text(), self.keyboard())
+                if PROGRESS_PARTIAL_EVERY and self.done - self._last_partial >= PROGRESS_PARTIAL_EVERY:
+                    self._last_partial = self.done
+                    await send_partial(self.message, self.spool.path, self.kind, self.output_format)
+            except TelegramError as e:
+                logger.warning(f"Progress update for job {self.job_id} failed: {e}")
+
+    async def _edit(self, text, reply_markup=None):
+        if text == self._last_text:
+            return
+        try:
+            await self.message.edit_text(text, reply_markup=reply_markup)
+            self._last_text = text
+        except RetryAfter as e:
+            # Skip this update; the next tick will carry the newer counts anyway
+            logger.info(f"Progress edit throttled by Telegram for {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+        except BadRequest as e:
+            logger.debug(f"Progress edit skipped: {e}")
+        except TelegramError as e:
+            logger.warning(f"Progress edit failed: {e}")
+
+    # A job stopped early was cancelled only if /cancel set its flag; otherwise
+    # it failed or the bot is shutting down and will resume it from its checkpoint
+    async def finish(self, completed=True):
+        if self._ticker is not None:
+            self._ticker.cancel()
+        elapsed = time.monotonic() - self.started_at
+        if completed:
+            await self._edit(f"Selesai: {self.done} baris dalam {elapsed:.0f} detik.")
+        elif self.job_id is not None and await shared_state().get(CANCEL_NS, self.job_id):
+            await self._edit(f"Dibatalkan setelah {self.done} baris ({elapsed:.0f} detik).")
+        else:
+            await self._edit(f"Dihentikan setelah {self.done} baris ({elapsed:.0f} detik).")
+
+# Function to send the rows a job has finished so far, rendered from its spool
+async def send_partial(message, spool_path, kind, output_format):
+    from core.writers import read_spool, render_results, send_output
+    count = 0
+
+    def counted(records):
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    # Rendering the whole spool so far is CPU and disk bound; keep it off the event loop
+    filename = await asyncio.to_thread(render_results, counted(read_spool(spool_path, kind)), kind, output_format,
+                                       prefix="partial")
+    await send_output(message.reply_document, filename, caption=f"Hasil sementara: {count} baris")
+
+# Callback handler for the "Kirim hasil sementara" button. The job record is
+# read from shared state, so any worker can answer for a job running elsewhere.
+async def handle_partial_request(update, context):
+    query = update.callback_query
+    record = await bulk_jobs.get(query.data.removeprefix("partial:"))
+    if record is None or record["state"] != RUNNING or not record.get("spool"):
+        await query.answer("Job sudah selesai atau tidak ditemukan.")
+        return
+    await query.answer("Mengirim hasil sementara...")
+    await send_partial(query.message, record["spool"], record["kind"], record["output_format"])
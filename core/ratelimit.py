@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+# Longest pause honoured from a Retry-After header, in seconds
+MAX_PAUSE = 60
+
+# Token bucket whose rate follows the upstream: halved whenever the host
+# throttles us (429/503/timeout) and raised by a small step per success,
+# so it backs off fast and recovers slowly
+class AdaptiveRateLimiter:
+    def __init__(self, rate, min_rate, recovery):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.recovery = recovery
+        self.rate = rate
+        self.tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_backoff = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            # Allow bursts of up to one second's worth of requests
+            self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def backoff(self, retry_after=None):
+        now = time.monotonic()
+        # Requests already in flight tend to fail together; count them once
+        if now - self._last_backoff >= 1:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._last_backoff = now
+        self.tokens = 0.0
+        pause = min(retry_after, MAX_PAUSE) if retry_after is not None else 1 / self.rate
+        self._paused_until = max(self._paused_until, now + pause)
+
+    def recover(self):
+        self.rate = min(self.max_rate, self.rate + self.recovery)
@@ -0,0 +1,205 @@
+import os
+import time
+import uuid
+from datetime import datetime
+from core.config import OUTPUT_DIR
+
+SIM_COLUMNS = ["MSISDN", "Card Status", "Activation Status", "Last 4 ICCID", "Message", "Checked At"]
+NIK_COLUMNS = ["NIK", "KK", "Status", "Nomor", "Message", "Sisa", "Checked At"]
+
+CHECKED_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+EXTENSIONS = {"csv": "csv", "txt": "txt", "excel": "xlsx"}
+
+# Base for lookup results. Records are slotted, so a large job holds small
+# fixed-layout objects instead of one dict per row, and rows that repeat an
+# input share the same record. They travel (spool, session, shared cache) as
+# plain JSON lists in __slots__ order.
+class Record:
+    __slots__ = ()
+
+    # Fields kept as one byte per row by RecordColumns
+    FLAGS = ("status", "transient", "rejected")
+
+    def to_json(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def from_json(cls, values):
+        # Spools and sessions written before records were typed hold dicts
+        if isinstance(values, dict):
+            return cls(**values)
+        return cls(*values)
+
+    def replace(self, **changes):
+        values = {field: getattr(self, field) for field in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.to_json() == other.to_json()
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+# Result of one SIM status lookup
+class SimRecord(Record):
+    __slots__ = ("msisdn", "status", "card_status", "activation_status", "last_4_iccid", "message", "transient",
+                 "rejected", "checked_at")
+
+    def __init__(self, msisdn, status, card_status="", activation_status="", last_4_iccid="", message="",
+                 transient=False, rejected=False, checked_at=None):
+        self.msisdn = msisdn
+        self.status = status
+        self.card_status = card_status
+        self.activation_status = activation_status
+        self.last_4_iccid = last_4_iccid
+        self.message = message
+        self.transient = transient
+        self.rejected = rejected
+        # When the row was actually looked up; kept when a result is reused
+        self.checked_at = checked_at if checked_at is not None else time.time()
+
+    # Lookup key; rows with the same key share one lookup
+    def key(self):
+        return self.msisdn
+
+    # The same result reported for an input row, shared when the row already matches
+    def for_input(self, msisdn):
+        return self if msisdn == self.msisdn else self.replace(msisdn=msisdn)
+
+# Result of one NIK/KK lookup
+class NikRecord(Record):
+    __slots__ = ("nik", "kk", "status", "nomor", "message", "sisa", "transient", "rejected", "checked_at")
+
+    def __init__(self, nik, kk, status, nomor=(), message="", sisa=3, transient=False, rejected=False,
+                 checked_at=None):
+        self.nik = nik
+        self.kk = kk
+        self.status = status
+        self.nomor = tuple(nomor)
+        self.message = message
+        self.sisa = sisa
+        self.transient = transient
+        self.rejected = rejected
+        self.checked_at = checked_at if checked_at is not None else time.time()
+
+    def key(self):
+        return (self.nik, self.kk)
+
+    def for_input(self, nik, kk):
+        return self if (nik, kk) == (self.nik, self.kk) else self.replace(nik=nik, kk=kk)
+
+RECORD_TYPES = {"sim": SimRecord, "nik": NikRecord}
+
+# Array-backed store for very large result sets: one column per field, flags
+# in a bytearray and repeated strings (statuses, messages) stored once.
+# Iterating yields records again, so writers take it like any record list.
+class RecordColumns:
+    def __init__(self, kind):
+        self.record_type = RECORD_TYPES[kind]
+        self._columns = {field: bytearray() if field in Record.FLAGS else []
+                         for field in self.record_type.__slots__}
+        self._strings = {}
+        self._count = 0
+
+    def append(self, record):
+        for field, column in self._columns.items():
+            value = getattr(record, field)
+            if field in Record.FLAGS:
+                value = bool(value)
+            elif isinstance(value, str):
+                value = self._strings.setdefault(value, value)
+            column.append(value)
+        self._count += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return self.record_type(**{field: bool(column[index]) if field in Record.FLAGS else column[index]
+                                   for field, column in self._columns.items()})
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+def format_checked_at(checked_at):
+    return datetime.fromtimestamp(checked_at).strftime(CHECKED_AT_FORMAT)
+
+def parse_checked_at(text):
+    return datetime.strptime(text.strip(), CHECKED_AT_FORMAT).timestamp()
+
+def sim_row(record):
+    return [record.msisdn, record.card_status, record.activation_status, record.last_4_iccid, record.message,
+            format_checked_at(record.checked_at)]
+
+def nik_row(record):
+    status = "Berhasil" if record.status else "Gagal"
+    return [record.nik, record.kk, status, ", ".join(record.nomor), record.message, record.sisa,
+            format_checked_at(record.checked_at)]
+
+def sim_line(record):
+    checked_at = format_checked_at(record.checked_at)
+    if record.status:
+        return f"MSISDN: {record.msisdn} | Card Status: {record.card_status} | Activation Status: {record.activation_status} | Last 4 ICCID: {record.last_4_iccid} | Checked At: {checked_at}\n"
+    return f"MSISDN: {record.msisdn} | Message: {record.message} | Checked At: {checked_at}\n"
+
+def nik_line(record):
+    return " | ".join(str(value) for value in nik_row(record)) + "\n"
+
+# Functions to read rows of an earlier CSV/XLSX export back into records.
+# Files from before the "Checked At" column use `checked_at` instead.
+def sim_from_row(row, checked_at):
+    row = list(row) + [""] * (len(SIM_COLUMNS) - len(row))
+    msisdn, card_status, activation_status, last_4_iccid, message, checked = row[:6]
+    return SimRecord(msisdn, bool(card_status) and not message, card_status, activation_status, last_4_iccid,
+                     message, checked_at=parse_checked_at(checked) if checked else checked_at)
+
+def nik_from_row(row, checked_at):
+    row = list(row) + [""] * (len(NIK_COLUMNS) - len(row))
+    nik, kk, status, nomor, message, sisa, checked = row[:7]
+    return NikRecord(nik, kk, status == "Berhasil", [n.strip() for n in nomor.split(",") if n.strip()], message,
+                     int(sisa) if str(sisa).strip().isdigit() else 3,
+                     checked_at=parse_checked_at(checked) if checked else checked_at)
+
+FROM_ROW = {"sim": (SIM_COLUMNS, sim_from_row), "nik": (NIK_COLUMNS, nik_from_row)}
+
+# Rows refused by input validation, written in their own section after the results
+SIM_REJECTED_COLUMNS = ["MSISDN", "Alasan"]
+NIK_REJECTED_COLUMNS = ["NIK", "KK", "Alasan"]
+
+def sim_rejected_row(record):
+    return [record.msisdn, record.message]
+
+def nik_rejected_row(record):
+    return [record.nik, record.kk, record.message]
+
+REJECTED = {
+    "sim": (SIM_REJECTED_COLUMNS, sim_rejected_row),
+    "nik": (NIK_REJECTED_COLUMNS, nik_rejected_row),
+}
+
+# Identifier columns that must stay text in spreadsheets (leading zeros, 16-digit NIK/KK)
+TEXT_COLUMNS = {
+    "sim": {0, 3},
+    "nik": {0, 1, 3},
+}
+
+# Column layout and row/line builders per job kind
+KINDS = {
+    "sim": (SIM_COLUMNS, sim_row, sim_line),
+    "nik": (NIK_COLUMNS, nik_row, nik_line),
+}
+
+# Function to build an output path under OUTPUT_DIR for a format. The random
+# suffix keeps jobs finishing in the same second from sharing one file.
+def output_filename(prefix, output_format):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return os.path.join(OUTPUT_DIR, f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}.{EXTENSIONS[output_format]}")
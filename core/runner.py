@@ -0,0 +1,38 @@
+import logging
+from core.config import BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+
+logger = logging.getLogger(__name__)
+
+# Arguments for Application.run_webhook / Updater.start_webhook
+def webhook_options():
+    return {
+        "listen": WEBHOOK_LISTEN,
+        "port": WEBHOOK_PORT,
+        "url_path": WEBHOOK_PATH,
+        "secret_token": WEBHOOK_SECRET or None,
+        "webhook_url": f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}" if WEBHOOK_URL else None,
+    }
+
+# Function to tell whether webhook mode is configured and can actually run
+def webhook_enabled():
+    if BOT_MODE != "webhook":
+        return False
+    if not WEBHOOK_URL:
+        logger.warning("BOT_MODE=webhook but WEBHOOK_URL is empty, falling back to polling")
+        return False
+    try:
+        import tornado  # noqa: F401 (installed by python-telegram-bot[webhooks])
+    except ImportError:
+        logger.warning("python-telegram-bot[webhooks] is not installed, falling back to polling")
+        return False
+    return True
+
+# Function to run the bot with a webhook listener when configured, else long polling
+def run_bot(application):
+    if webhook_enabled():
+        options = webhook_options()
+        logger.info(f"Serving updates on {options['listen']}:{options['port']}/{options['url_path']} "
+                    f"for {options['webhook_url']} (secret token {'on' if options['secret_token'] else 'off'})")
+        application.run_webhook(**options)
+    else:
+        application.run_polling()
@@ -0,0 +1,81 @@
+import asyncio
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+
+# User on whose behalf the current task is making lookups. Bulk job workers
+# set it; tasks created inside a job inherit it. Interactive commands keep
+# the default and share one lane of their own.
+current_user = ContextVar("current_user", default=None)
+
+# Concurrency limit that hands free slots to waiting users in round-robin
+# order instead of first-come-first-served, so one large job cannot starve
+# a small one submitted after it
+class FairLimiter:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._active_by_user = {}
+        self._waiters = OrderedDict()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    async def acquire(self):
+        user = current_user.get()
+        if self.active < self.limit and not self._waiters:
+            self._grant(user)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release(user)
+            else:
+                self._forget(user, waiter)
+            raise
+
+    def release(self, user=None):
+        user = current_user.get() if user is None else user
+        self.active -= 1
+        remaining = self._active_by_user.get(user, 1) - 1
+        if remaining:
+            self._active_by_user[user] = remaining
+        else:
+            self._active_by_user.pop(user, None)
+        self._wake()
+
+    def _grant(self, user):
+        self.active += 1
+        self._active_by_user[user] = self._active_by_user.get(user, 0) + 1
+
+    # Serve the user at the head of the rotation, then move them to the back.
+    # A waiter cancelled before its task ran again is skipped without a slot.
+    def _wake(self):
+        while self.active < self.limit and self._waiters:
+            user, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiters.move_to_end(user)
+            else:
+                del self._waiters[user]
+            if waiter.done():
+                continue
+            waiter.set_result(None)
+            self._grant(user)
+
+    def _forget(self, user, waiter):
+        waiters = self._waiters.get(user)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiters[user]
+
+    # Function to report (waiting, active) lookups for a user
+    def depth(self, user):
+        return len(self._waiters.get(user, ())), self._active_by_user.get(user, 0)
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from core.config import APP_NAME, SESSION_TTL, SESSION_MAX_BYTES, SESSION_MEMORY_BUDGET, SESSION_SPILL_DIR
+from core.state import MemoryState, app_namespace, shared_state
+
+logger = logging.getLogger(__name__)
+
+# Per-user conversation state (pending spreadsheet URL or MSISDN list, results
+# waiting for a format choice, finished job spools). It lives in the shared
+# state backend instead of context.user_data, so whichever worker receives the
+# user's next message or button press sees the same session. Sessions expire
+# after SESSION_TTL and may not grow past SESSION_MAX_BYTES.
+
+# Namespace of the sessions in a shared backend; spilled local sessions go in
+# a directory of the same name. Each bot keeps its own sessions.
+SESSION_NS = app_namespace("session")
+
+class SessionTooLarge(ValueError):
+    pass
+
+# Sessions of a single-process bot, held zlib-compressed in LRU order. Once
+# they take more than `budget` bytes the least recently used are written to
+# `spill_dir` and read back (and dropped from disk) on the user's next access.
+class LocalSessions:
+    def __init__(self, budget, spill_dir):
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.memory_bytes = 0
+        self._memory = OrderedDict()
+        self._last_sweep = time.time()
+
+    def get(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= len(entry[0])
+        else:
+            entry = self._read_spill(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        self._put(key, entry)
+        return json.loads(zlib.decompress(entry[0]))
+
+    def set(self, key, blob, expires_at):
+        self.delete(key)
+        self._put(key, (blob, expires_at))
+        self._sweep()
+
+    def delete(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self.memory_bytes -= len(entry[0])
+        self._remove_spill(key)
+
+    def _put(self, key, entry):
+        self._memory[key] = entry
+        self.memory_bytes += len(entry[0])
+        while self.memory_bytes > self.budget and len(self._memory) > 1:
+            spilled_key, spilled = self._memory.popitem(last=False)
+            self.memory_bytes -= len(spilled[0])
+            self._write_spill(spilled_key, spilled)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.session")
+
+    # Spill file: expiry timestamp (8 bytes) followed by the compressed session
+    def _write_spill(self, key, entry):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = self._spill_path(key)
+        with open(path + ".tmp", "wb") as file:
+            file.write(struct.pack("<d", entry[1]) + entry[0])
+        os.replace(path + ".tmp", path)
+
+    def _read_spill(self, key):
+        try:
+            with open(self._spill_path(key), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        self._remove_spill(key)
+        return data[8:], struct.unpack("<d", data[:8])[0]
+
+    def _remove_spill(self, key):
+        try:
+            os.remove(self._spill_path(key))
+        except FileNotFoundError:
+            pass
+
+    # Drop expired sessions from memory and disk, at most once a minute
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for key in [key for key, (_, expires_at) in self._memory.items() if expires_at <= now]:
+            self.delete(key)
+        if os.path.isdir(self.spill_dir):
+            for name in os.listdir(self.spill_dir):
+                if not name.endswith(".session"):
+                    continue
+                with open(os.path.join(self.spill_dir, name), "rb") as file:
+                    expires_at = struct.unpack("<d", file.read(8))[0]
+                if expires_at <= now:
+                    self._remove_spill(name.removesuffix(".session"))
+
+    def stats(self):
+        spilled = len(os.listdir(self.spill_dir)) if os.path.isdir(self.spill_dir) else 0
+        return {"in_memory": len(self._memory), "memory_bytes": self.memory_bytes, "spilled": spilled}
+
+_local = None
+
+# Function to get the in-process session store, or None when sessions live
+# in a shared backend (and so outside this process's memory)
+def local_sessions():
+    global _local
+    if _local is None and isinstance(shared_state(), MemoryState):
+        _local = LocalSessions(SESSION_MEMORY_BUDGET, os.path.join(SESSION_SPILL_DIR, APP_NAME))
+    return _local
+
+async def load_session(user_id):
+    local = local_sessions()
+    if local is not None:
+        return local.get(str(user_id)) or {}
+    return await shared_state().get(SESSION_NS, str(user_id)) or {}
+
+async def save_session(user_id, session):
+    data = json.dumps(session, separators=(",", ":"))
+    if len(data) > SESSION_MAX_BYTES:
+        raise SessionTooLarge(
+            f"Data terlalu besar ({len(data) // 1024} KiB, batas {SESSION_MAX_BYTES // 1024} KiB). "
+            "Kirim dalam beberapa bagian."
+        )
+    local = local_sessions()
+    if local is not None:
+        if session:
+            local.set(str(user_id), zlib.compress(data.encode()), time.time() + SESSION_TTL)
+        else:
+            local.delete(str(user_id))
+    elif session:
+        await shared_state().set(SESSION_NS, str(user_id), session, ttl=SESSION_TTL)
+    else:
+        await shared_state().delete(SESSION_NS, str(user_id))
+
+# Function to report session memory for /cachestats and logs
+def session_stats():
+    local = local_sessions()
+    if local is None:
+        return {"in_memory": 0, "memory_bytes": 0, "spilled": 0}
+    return local.stats()
@@ -0,0 +1,89 @@
+import csv
+import logging
+from collections import deque
+from core.upstream import get_client
+
+logger = logging.getLogger(__name__)
+
+# Lines one record may span before an opening quote that never closes is
+# treated as a stray character instead of swallowing the rest of the sheet
+MAX_RECORD_LINES = 100
+
+# Line source for a single csv.reader that can run dry and be refilled as the
+# body arrives. The reader only asks for another line while its record is
+# unfinished, so running dry means the record continues past what we have.
+class _LineFeed:
+    def __init__(self):
+        self.lines = deque()
+        self.taken = []
+        self.dry = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            self.dry = True
+            raise StopIteration
+        line = self.lines.popleft()
+        self.taken.append(line)
+        return line
+
+# Function to parse the complete records buffered in `feed`. An unfinished
+# record is put back to wait for more lines, unless the body has ended.
+def _parse_rows(reader, feed, url, final=False):
+    while feed.lines:
+        feed.taken, feed.dry = [], False
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        if feed.dry and not final:
+            if len(feed.taken) < MAX_RECORD_LINES:
+                feed.lines.extendleft(reversed(feed.taken))
+                return
+            logger.warning(f"Quoted field spans more than {MAX_RECORD_LINES} lines in {url}, reading it as one line")
+            feed.lines.extendleft(reversed(feed.taken[1:]))
+            row = next(csv.reader([feed.taken[0].rstrip("\n")]), [])
+        elif feed.dry:
+            logger.warning(f"Unterminated quoted field at end of {url}")
+        yield row
+
+# Function to stream CSV rows from a spreadsheet export URL.
+# Rows are decoded and parsed as the body arrives, so the first lookup can
+# start before the download finishes and the full body is never held in memory.
+async def stream_csv_rows(url, skip_header=True):
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    header = skip_header
+    async with get_client(url).stream("GET", url, follow_redirects=True) as response:
+        response.raise_for_status()
+        first_line = True
+        async for line in response.aiter_lines():
+            if first_line:
+                line = line.lstrip("\ufeff")
+                first_line = False
+            # aiter_lines strips line endings; a quoted field keeps its line breaks
+            feed.lines.append(line + "\n")
+            for row in _parse_rows(reader, feed, url):
+                if header:
+                    header = False
+                elif row:
+                    yield row
+        for row in _parse_rows(reader, feed, url, final=True):
+            if header:
+                header = False
+            elif row:
+                yield row
+
+# Function to stream (NIK, KK) pairs from the first two columns of a sheet
+async def stream_nik_pairs(url):
+    async for row in stream_csv_rows(url):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+# Function to stream MSISDNs from the first column of a sheet
+async def stream_msisdns(url):
+    async for row in stream_csv_rows(url):
+        if row[0].strip():
+            yield row[0]
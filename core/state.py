@@ -0,0 +1,202 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from core.config import APP_NAME, STATE_BACKEND, STATE_PATH, STATE_URL, UPSTREAM_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# State shared by every bot worker: JSON values in namespaces ("session",
+# "job", "sim", ...) with optional TTLs, plus FIFO queues of pending jobs.
+# All backends expose the same async methods, so workers only need to agree
+# on STATE_BACKEND to answer each other's callbacks and split the job queue.
+# Several bots may share one backend: their sessions and job records go in
+# namespaces scoped by app_namespace(), while cached lookups ("sim") are
+# the same for every bot and stay shared.
+
+# In-process backend, the default for a single bot process. Values are stored
+# serialized so callers never share mutable objects, as with the other backends.
+# Expired entries are dropped when read and by a sweep at most once a minute,
+# so job records and cancel flags nobody reads again do not pile up.
+class MemoryState:
+    def __init__(self):
+        self._values = {}
+        self._queues = {}
+        self._last_sweep = time.time()
+
+    async def get(self, ns, key):
+        entry = self._values.get((ns, key))
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._values[(ns, key)]
+            return None
+        return json.loads(value)
+
+    async def set(self, ns, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._values[(ns, key)] = (json.dumps(value), expires_at)
+        self._sweep()
+
+    async def delete(self, ns, key):
+        self._values.pop((ns, key), None)
+
+    async def values(self, ns):
+        self._sweep()
+        now = time.time()
+        return [json.loads(value) for (entry_ns, _), (value, expires_at) in list(self._values.items())
+                if entry_ns == ns and (expires_at is None or expires_at > now)]
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for entry_key in [entry_key for entry_key, (_, expires_at) in self._values.items()
+                          if expires_at is not None and expires_at <= now]:
+            del self._values[entry_key]
+
+    async def push(self, queue, value):
+        self._queues.setdefault(queue, []).append(json.dumps(value))
+
+    async def pop(self, queue):
+        items = self._queues.get(queue)
+        return json.loads(items.pop(0)) if items else None
+
+    async def close(self):
+        pass
+
+# SQLite backend for several worker processes on one host. WAL mode lets
+# readers and the single writer run side by side; queue pops are one
+# DELETE ... RETURNING statement, so two workers never take the same job.
+# Statements run on one dedicated thread, so waiting on another worker's lock
+# (up to the 10 s busy timeout) never blocks the event loop.
+class SqliteState:
+    def __init__(self, path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-state")
+        self._db = sqlite3.connect(path, isolation_level=None, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS kv (ns TEXT, key TEXT, value TEXT, expires_at REAL, PRIMARY KEY (ns, key))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, value TEXT)")
+        self._db.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+        logger.info(f"Opened shared state at {path}")
+
+    # Function to run one statement on the state thread; fetch is None, "one" or "all"
+    async def _execute(self, sql, params, fetch=None):
+        def run():
+            cursor = self._db.execute(sql, params)
+            if fetch == "one":
+                return cursor.fetchone()
+            if fetch == "all":
+                return cursor.fetchall()
+            return None
+        return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+
+    async def get(self, ns, key):
+        row = await self._execute(
+            "SELECT value FROM kv WHERE ns = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (ns, key, time.time()), "one",
+        )
+        return json.loads(row[0]) if row else None
+
+    async def set(self, ns, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        await self._execute(
+            "INSERT OR REPLACE INTO kv (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (ns, key, json.dumps(value), expires_at),
+        )
+
+    async def delete(self, ns, key):
+        await self._execute("DELETE FROM kv WHERE ns = ? AND key = ?", (ns, key))
+
+    async def values(self, ns):
+        rows = await self._execute(
+            "SELECT value FROM kv WHERE ns = ? AND (expires_at IS NULL OR expires_at > ?)", (ns, time.time()), "all"
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    async def push(self, queue, value):
+        await self._execute("INSERT INTO queue (name, value) VALUES (?, ?)", (queue, json.dumps(value)))
+
+    async def pop(self, queue):
+        row = await self._execute(
+            "DELETE FROM queue WHERE id = (SELECT id FROM queue WHERE name = ? ORDER BY id LIMIT 1) RETURNING value",
+            (queue,), "one",
+        )
+        return json.loads(row[0]) if row else None
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._db.close)
+        self._executor.shutdown()
+
+# Client for the network key-value stand-in served by `python -m core.kvserver`,
+# for workers on different hosts. Each method is one JSON POST.
+class HttpState:
+    def __init__(self, url):
+        import httpx
+        self.url = url.rstrip("/")
+        self._client = httpx.AsyncClient(base_url=self.url, timeout=UPSTREAM_TIMEOUT)
+        logger.info(f"Using shared state server at {self.url}")
+
+    async def _call(self, method, **params):
+        response = await self._client.post(f"/{method}", json=params)
+        response.raise_for_status()
+        return response.json().get("value")
+
+    async def get(self, ns, key):
+        return await self._call("get", ns=ns, key=key)
+
+    async def set(self, ns, key, value, ttl=None):
+        await self._call("set", ns=ns, key=key, value=value, ttl=ttl)
+
+    async def delete(self, ns, key):
+        await self._call("delete", ns=ns, key=key)
+
+    async def values(self, ns):
+        return await self._call("values", ns=ns)
+
+    async def push(self, queue, value):
+        await self._call("push", queue=queue, value=value)
+
+    async def pop(self, queue):
+        return await self._call("pop", queue=queue)
+
+    async def close(self):
+        await self._client.aclose()
+
+# Function to build the backend selected by STATE_BACKEND
+def open_state(backend=STATE_BACKEND):
+    if backend == "sqlite":
+        return SqliteState(STATE_PATH)
+    if backend == "http":
+        return HttpState(STATE_URL)
+    if backend != "memory":
+        logger.warning(f"Unknown STATE_BACKEND {backend!r}, using in-process state")
+    return MemoryState()
+
+_state = None
+
+# Function to scope a namespace to this bot
+def app_namespace(name):
+    return f"{APP_NAME}:{name}"
+
+# Function to get the process-wide shared state backend
+def shared_state():
+    global _state
+    if _state is None:
+        _state = open_state()
+    return _state
+
+# Function to close the shared state backend, used on shutdown
+async def close_state(application=None):
+    global _state
+    if _state is not None:
+        await _state.close()
+        _state = None
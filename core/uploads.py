@@ -0,0 +1,257 @@
+import asyncio
+import csv
+import logging
+import os
+from itertools import chain, islice
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import CallbackQueryHandler, MessageHandler, filters
+from core.bulk import BatchStats, iter_nik_records, iter_sim_records
+from core.config import JOB_DIR, UPLOAD_MAX_BYTES
+from core.jobs import bulk_jobs, job_type, submit_job
+from core.normalize import check_id, check_msisdn
+from core.progress import JobProgress
+from core.session import load_session, save_session
+from core.writers import ResultSpool, send_output, write_job
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_EXTENSIONS = (".csv", ".xlsx")
+
+# Header names (lowercase, letters and digits only) recognised per column
+HEADER_NAMES = {
+    "msisdn": {"msisdn", "nomor", "nomorhp", "nohp", "hp", "phone", "telepon", "notelp", "notelepon", "number"},
+    "nik": {"nik", "noktp", "ktp", "nomornik", "nomorktp"},
+    "kk": {"kk", "nokk", "nomorkk", "kartukeluarga"},
+}
+# Rows read up front to detect the columns when there is no usable header
+SAMPLE_ROWS = 20
+# Share of sampled values that must be valid for a column to be picked by content
+MIN_VALID_SHARE = 0.5
+# Values read from the file per trip to the reader thread
+READ_BATCH_ROWS = 500
+
+KIND_NAMES = {"sim": "MSISDN", "nik": "NIK/KK"}
+
+class UploadError(ValueError):
+    pass
+
+# Function to read rows from an uploaded CSV one line at a time; the
+# delimiter (",", ";" or tab, as spreadsheet exports differ) is sniffed first
+def _csv_rows(path):
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as file:
+        sample = file.read(4096)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(file, dialect)
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    # Numeric cells come back as floats; NIK/KK and MSISDNs must not gain a ".0"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+# Function to read rows from the first sheet of an uploaded XLSX with a
+# read-only workbook, which parses the sheet XML as rows are requested
+def _xlsx_rows(path):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [_cell_text(value) for value in row]
+    finally:
+        workbook.close()
+
+READERS = {".csv": _csv_rows, ".xlsx": _xlsx_rows}
+
+def _header_key(value):
+    return "".join(ch for ch in value.lower() if ch.isalnum())
+
+def _cell(row, index):
+    return row[index] if index < len(row) else ""
+
+# Columns whose sampled non-empty values mostly pass `valid`. An invalid
+# value in the first row is left out, as it may be an unrecognised header.
+def _valid_columns(rows, valid):
+    width = max(len(row) for row in rows)
+    columns = []
+    for index in range(width):
+        values = [_cell(row, index) for row in rows if _cell(row, index).strip()]
+        if values and not valid(_cell(rows[0], index)):
+            values = [_cell(row, index) for row in rows[1:] if _cell(row, index).strip()]
+        if values and sum(1 for value in values if valid(value)) / len(values) >= MIN_VALID_SHARE:
+            columns.append(index)
+    return columns
+
+# Function to find the input columns in the first rows of a file.
+# Returns (kind, column indexes, has_header) or None. A header naming the
+# columns wins; otherwise columns are picked by what their values look like.
+def detect_columns(rows):
+    header = [_header_key(value) for value in rows[0]]
+    named = {field: next((index for index, name in enumerate(header) if name in names), None)
+             for field, names in HEADER_NAMES.items()}
+    if named["nik"] is not None and named["kk"] is not None:
+        return "nik", (named["nik"], named["kk"]), True
+    if named["msisdn"] is not None:
+        return "sim", (named["msisdn"],), True
+
+    id_columns = _valid_columns(rows, lambda value: check_id(value)[1] is None)
+    if len(id_columns) >= 2:
+        columns, kind = tuple(id_columns[:2]), "nik"
+    else:
+        msisdn_columns = _valid_columns(rows, lambda value: check_msisdn(value)[1] is None)
+        if not msisdn_columns:
+            return None
+        columns, kind = (msisdn_columns[0],), "sim"
+    # The first row is a header unless it holds valid values itself
+    if kind == "nik":
+        has_header = any(check_id(_cell(rows[0], index))[1] for index in columns)
+    else:
+        has_header = check_msisdn(_cell(rows[0], columns[0]))[1] is not None
+    return kind, columns, has_header
+
+# Function to open an uploaded file as bulk input.
+# Returns (kind, column names, values) where values is a lazy iterator of
+# MSISDNs or (NIK, KK) pairs, so the file is never held in memory at once.
+def open_upload(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise UploadError("Format file tidak didukung. Kirim file CSV atau XLSX.")
+    rows = READERS[extension](path)
+    sample = [row for row in islice(rows, SAMPLE_ROWS) if any(cell.strip() for cell in row)]
+    if not sample:
+        rows.close()
+        raise UploadError("File kosong.")
+    detected = detect_columns(sample)
+    if detected is None:
+        rows.close()
+        raise UploadError("Kolom MSISDN atau NIK/KK tidak ditemukan di file.")
+    kind, columns, has_header = detected
+    names = [_cell(sample[0], index) if has_header else f"kolom {index + 1}" for index in columns]
+
+    def values():
+        try:
+            for row in chain(sample[1:] if has_header else sample, rows):
+                picked = [_cell(row, index) for index in columns]
+                if not any(value.strip() for value in picked):
+                    continue
+                yield picked[0] if kind == "sim" else tuple(picked)
+        finally:
+            rows.close()
+
+    return kind, names, values()
+
+# Function to iterate the values from open_upload on a worker thread, a batch
+# at a time. The next batch is read while the current one is being looked up,
+# so parsing never blocks the event loop and at most one batch waits ahead.
+async def read_in_thread(values):
+    def next_batch():
+        return list(islice(values, READ_BATCH_ROWS))
+
+    # The generator may still be running on the thread; close it once it stops
+    def close(future):
+        if not future.cancelled():
+            future.exception()
+        values.close()
+
+    pending = asyncio.ensure_future(asyncio.to_thread(next_batch))
+    try:
+        while True:
+            batch = await asyncio.shield(pending)
+            if not batch:
+                return
+            pending = asyncio.ensure_future(asyncio.to_thread(next_batch))
+            for value in batch:
+                yield value
+    finally:
+        pending.add_done_callback(close)
+
+# Tombol pilihan format output untuk file unggahan
+def upload_keyboard():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("CSV", callback_data="upload:csv"),
+         InlineKeyboardButton("TXT", callback_data="upload:txt"),
+         InlineKeyboardButton("Excel", callback_data="upload:excel")]
+    ])
+
+# Document handler: remember the uploaded file and ask for an output format.
+# Only the Telegram file ID is kept; the job downloads the file on whichever
+# worker runs it.
+async def handle_upload(update, context):
+    document = update.message.document
+    file_name = document.file_name or ""
+    if not file_name.lower().endswith(UPLOAD_EXTENSIONS):
+        await update.message.reply_text("Format file tidak didukung. Kirim file CSV atau XLSX.")
+        return
+    if document.file_size and document.file_size > UPLOAD_MAX_BYTES:
+        await update.message.reply_text(f"File terlalu besar (maksimal {UPLOAD_MAX_BYTES // (1024 * 1024)} MB).")
+        return
+
+    session = await load_session(update.effective_user.id)
+    session['upload'] = {"file_id": document.file_id, "file_name": file_name}
+    await save_session(update.effective_user.id, session)
+    await update.message.reply_text(f"File {file_name} diterima. Pilih format output:", reply_markup=upload_keyboard())
+
+# Function to build the handlers for uploaded files, for a bot that checks the given kinds
+def upload_handlers(kinds=("sim", "nik")):
+    async def handle_upload_format(update, context):
+        query = update.callback_query
+        await query.answer()
+        session = await load_session(update.effective_user.id)
+        upload = session.pop('upload', None)
+        if upload is None:
+            await query.edit_message_text("File tidak ditemukan. Silakan unggah ulang.")
+            return
+        await save_session(update.effective_user.id, session)
+        await query.edit_message_reply_markup(reply_markup=None)
+        await submit_job(query.message, update.effective_user.id, f"cek file {upload['file_name']}", "upload",
+                         dict(upload, output_format=query.data.removeprefix("upload:"), kinds=list(kinds)))
+
+    return [
+        MessageHandler(filters.Document.ALL, handle_upload),
+        CallbackQueryHandler(handle_upload_format, pattern="^upload:"),
+    ]
+
+# Bulk job: download the file, detect its columns and stream the rows into
+# the same lookup and export pipeline as pasted lists and spreadsheets
+@job_type("upload")
+async def upload_job(job, bot):
+    file_name, output_format = job.params["file_name"], job.params["output_format"]
+    os.makedirs(JOB_DIR, exist_ok=True)
+    path = os.path.join(JOB_DIR, f"upload_{job.id}{os.path.splitext(file_name)[1].lower()}")
+    try:
+        telegram_file = await bot.get_file(job.params["file_id"])
+        await telegram_file.download_to_drive(path)
+        # Opening a workbook parses its shared strings, so it runs off the event loop too
+        kind, columns, values = await asyncio.to_thread(open_upload, path)
+        if kind not in job.params["kinds"]:
+            values.close()
+            raise UploadError(f"File berisi {KIND_NAMES[kind]}, yang tidak diperiksa oleh bot ini.")
+
+        status_message = await bot.send_message(
+            job.chat_id, f"Job {job.id}: {KIND_NAMES[kind]} dari kolom {', '.join(columns)}.\nSedang memproses..."
+        )
+        spool = ResultSpool.for_job(job, "upload", kind)
+        stats = BatchStats(spool)
+        job.spool, job.kind, job.output_format = spool.path, kind, output_format
+        job.progress = JobProgress(status_message, kind, output_format, spool=spool, job_id=job.id)
+        await bulk_jobs.save(job)
+        values = read_in_thread(values)
+        records = iter_sim_records(values, stats=stats) if kind == "sim" else iter_nik_records(values, stats=stats)
+        # The spool stays for delta re-checks against this job
+        filename = await write_job(records, kind, output_format, prefix="upload", spool=spool, progress=job.progress)
+
+        job.summary = stats.summary()
+        await send_output(bot.send_document, filename, chat_id=job.chat_id)
+        await bot.send_message(job.chat_id, f"Proses selesai: {stats.summary()}.")
+    except Exception as e:
+        logger.error(f"Upload job {job.id} failed: {e}")
+        await bot.send_message(job.chat_id, f"Terjadi kesalahan: {e}")
+        raise
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
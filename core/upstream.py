@@ -0,0 +1,294 @@
+import asyncio
+import logging
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from urllib.parse import urlsplit
+import httpx
+from core.breaker import CircuitBreaker, CircuitOpen, retry_delay
+from core.cache import sim_cache
+from core.config import (TRI_BASE_URL, IM3_BASE_URL, UPSTREAM_POOL_SIZE, UPSTREAM_KEEPALIVE_EXPIRY, UPSTREAM_TIMEOUT, UPSTREAM_HOST_CONCURRENCY,
+                         UPSTREAM_RATE, UPSTREAM_MIN_RATE, UPSTREAM_RATE_RECOVERY, THROTTLE_REQUEUE_LIMIT,
+                         UPSTREAM_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY, BREAKER_FAILURES, BREAKER_COOLDOWN)
+from core.extract import extract_nik_result
+from core.normalize import normalize_msisdn
+from core.ratelimit import AdaptiveRateLimiter
+from core.results import NikRecord, SimRecord
+from core.scheduler import FairLimiter
+
+logger = logging.getLogger(__name__)
+
+# URLs for NIK/KK checking
+NIK_URL_POST = f"{IM3_BASE_URL}/ceknomor/checkForm"
+NIK_URL_RESULT = f"{IM3_BASE_URL}/ceknomor/result"
+
+# URL for SIM status checking
+SIM_STATUS_URL = f"{TRI_BASE_URL}/api/v1/information/sim-status"
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.6778.140 Safari/537.36"
+
+# One long-lived client (and connection pool) per upstream host
+_clients = {}
+# Cap on concurrent requests per upstream host, shared fairly between users
+_host_slots = {}
+# Adaptive request rate per upstream host
+_host_limiters = {}
+# Circuit breaker per upstream host
+_host_breakers = {}
+
+# Responses that mean "slow down" rather than "this row failed"
+THROTTLE_STATUSES = (429, 503)
+# Server errors worth retrying; anything else is the row's own answer
+TRANSIENT_STATUSES = (500, 502, 504)
+
+class Throttled(Exception):
+    def __init__(self, reason, retry_after=None, status_code=None):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+class TransientError(Exception):
+    pass
+
+# Shared clients must not carry cookies from one lookup into another,
+# so the client-level jar refuses everything and callers pass cookies explicitly
+def _no_cookies():
+    return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+# Function to get the pooled client for the host of a URL
+def get_client(url):
+    host = urlsplit(url).netloc
+    client = _clients.get(host)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_POOL_SIZE,
+                max_keepalive_connections=UPSTREAM_POOL_SIZE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            headers={"Accept-Encoding": "gzip, deflate"},
+            cookies=_no_cookies(),
+        )
+        _clients[host] = client
+        logger.info(f"Opened connection pool for {host} (size {UPSTREAM_POOL_SIZE})")
+    return client
+
+# Function to get the concurrency slot for the host of a URL
+def host_slot(url):
+    host = urlsplit(url).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = FairLimiter(UPSTREAM_HOST_CONCURRENCY)
+    return slot
+
+# Function to get the rate limiter for the host of a URL
+def host_limiter(url):
+    host = urlsplit(url).netloc
+    limiter = _host_limiters.get(host)
+    if limiter is None:
+        limiter = _host_limiters[host] = AdaptiveRateLimiter(UPSTREAM_RATE, UPSTREAM_MIN_RATE, UPSTREAM_RATE_RECOVERY)
+    return limiter
+
+# Function to get the circuit breaker for the host of a URL
+def host_breaker(url):
+    host = urlsplit(url).netloc
+    breaker = _host_breakers.get(host)
+    if breaker is None:
+        breaker = _host_breakers[host] = CircuitBreaker(host, BREAKER_FAILURES, BREAKER_COOLDOWN)
+    return breaker
+
+# Function to report (state, trips) of every upstream breaker
+def breaker_states():
+    return {host: (breaker.state, breaker.trips) for host, breaker in _host_breakers.items()}
+
+def _raise_for_upstream(response):
+    if response.status_code in THROTTLE_STATUSES:
+        try:
+            retry_after = float(response.headers.get("Retry-After", ""))
+        except ValueError:
+            retry_after = None
+        raise Throttled(f"HTTP {response.status_code}", retry_after, response.status_code)
+    if response.status_code in TRANSIENT_STATUSES:
+        raise TransientError(f"HTTP {response.status_code}")
+
+# Function to run one upstream request under the host's circuit breaker and
+# rate limit. A throttled attempt slows the host down and goes back to wait
+# for a token instead of turning into a failed row; connection errors and
+# 5xx answers are retried with jittered backoff when the caller declares the
+# request idempotent. A 429 was refused before the request was acted on and
+# is always re-queued; a timeout or 503 may not have been, so it is re-queued
+# only for an idempotent request and raised otherwise.
+async def _limited(url, request, idempotent):
+    limiter = host_limiter(url)
+    breaker = host_breaker(url)
+    host = urlsplit(url).netloc
+    requeues = retries = 0
+    while True:
+        breaker.check()
+        await limiter.acquire()
+        try:
+            async with host_slot(url):
+                result = await request()
+        except (Throttled, httpx.TimeoutException) as e:
+            limiter.backoff(getattr(e, "retry_after", None))
+            # 429 is about our pace; an unavailable or silent host counts against the breaker
+            if getattr(e, "status_code", None) != 429:
+                breaker.record_failure()
+                if not idempotent:
+                    raise
+            requeues += 1
+            if requeues > THROTTLE_REQUEUE_LIMIT:
+                raise Throttled(f"masih dibatasi setelah {THROTTLE_REQUEUE_LIMIT} percobaan ulang")
+            logger.warning(f"{host} throttled ({e or type(e).__name__}), rate now {limiter.rate:.2f}/s, "
+                           f"re-queued (attempt {requeues})")
+            continue
+        except (TransientError, httpx.TransportError) as e:
+            breaker.record_failure()
+            if not idempotent or retries >= UPSTREAM_RETRIES:
+                raise
+            retries += 1
+            delay = retry_delay(retries, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+            logger.warning(f"{host} failed ({e or type(e).__name__}), retry {retries}/{UPSTREAM_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        limiter.recover()
+        breaker.record_success()
+        return result
+
+# Failures of the upstream itself rather than answers about the row
+UPSTREAM_ERRORS = (Throttled, CircuitOpen, TransientError, httpx.TransportError)
+
+def _upstream_failure_message(e):
+    if isinstance(e, Throttled):
+        return f"Server sedang membatasi permintaan: {e}"
+    if isinstance(e, CircuitOpen):
+        return str(e)
+    return f"Request Error: {e}"
+
+# Function to report a user's waiting and in-flight lookups per upstream host
+def lookup_depth(user):
+    return {host: slot.depth(user) for host, slot in _host_slots.items()}
+
+# Function to close every pooled client, used as Application.post_shutdown
+async def close_clients(application=None):
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+# Function to check NIK/KK
+async def check_nik_kk(nik, kk):
+    headers = {
+        "Host": urlsplit(IM3_BASE_URL).netloc,
+        "User-Agent": USER_AGENT,
+        "Origin": IM3_BASE_URL,
+        "Content-Type": "application/x-www-form-urlencoded",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+        "Referer": f"{IM3_BASE_URL}/ceknomor/",
+    }
+
+    payload = {
+        "nik": nik,
+        "kk": kk,
+        "g-recaptcha-response": "",
+        "send": "PERIKSA"
+    }
+
+    client = get_client(NIK_URL_POST)
+
+    async def request():
+        post_response = await client.post(NIK_URL_POST, headers=headers, data=payload)
+        _raise_for_upstream(post_response)
+        if post_response.status_code != 302:
+            return post_response, None
+
+        # The session cookie from checkForm is needed to read the result page
+        result_headers = dict(headers)
+        session_cookie = "; ".join(f"{name}={value}" for name, value in post_response.cookies.items())
+        if session_cookie:
+            result_headers["Cookie"] = session_cookie
+        get_response = await client.get(NIK_URL_RESULT, headers=result_headers)
+        _raise_for_upstream(get_response)
+        return post_response, get_response
+
+    try:
+        # checkForm only looks the pair up; a retry just opens a fresh result session
+        post_response, get_response = await _limited(NIK_URL_POST, request, idempotent=True)
+    except UPSTREAM_ERRORS as e:
+        logger.error(f"NIK/KK lookup failed: {e}")
+        return NikRecord(nik, kk, False, message=_upstream_failure_message(e), transient=True)
+    except httpx.HTTPError as e:
+        logger.error(f"Error during request: {e}")
+        return NikRecord(nik, kk, False, message=f"Request Error: {e}")
+
+    if get_response is None:
+        return NikRecord(nik, kk, False, message=f"POST request failed with status code {post_response.status_code}")
+
+    if get_response.status_code != 200:
+        return NikRecord(nik, kk, False, message=f"GET request failed with status code {get_response.status_code}")
+
+    extracted = extract_nik_result(get_response.text)
+    if extracted:
+        _, nomor = extracted
+        sisa = 3 - len(nomor)
+
+        return NikRecord(nik, kk, True, nomor=nomor, sisa=sisa)
+    return NikRecord(nik, kk, False, message="Data tidak ditemukan atau format respons berubah.")
+
+# Function to check SIM status, answering repeats from the result cache
+async def check_sim_status(msisdn, use_cache=True):
+    key = normalize_msisdn(msisdn)
+    if use_cache:
+        cached = await sim_cache.get(key)
+        if cached is not None:
+            return cached
+
+    result = await _request_sim_status(key)
+    # A lookup the upstream could not answer says nothing about the number, so it is not cached
+    if not result.transient:
+        await sim_cache.set(key, result)
+    return result
+
+async def _request_sim_status(msisdn):
+    headers = {
+        "Accept": "application/json, text/plain, */*",
+        "Content-Type": "application/json",
+        "User-Agent": USER_AGENT,
+        "Origin": TRI_BASE_URL,
+        "Referer": f"{TRI_BASE_URL}/",
+    }
+
+    payload = {
+        "action": "MSISDN_STATUS_WEB",
+        "input1": "",
+        "input2": "",
+        "language": "ID",
+        "msisdn": msisdn
+    }
+
+    async def request():
+        response = await get_client(SIM_STATUS_URL).post(SIM_STATUS_URL, headers=headers, json=payload)
+        _raise_for_upstream(response)
+        response.raise_for_status()
+        return response
+
+    try:
+        # A status query changes nothing upstream, so it is safe to send again
+        response = await _limited(SIM_STATUS_URL, request, idempotent=True)
+    except UPSTREAM_ERRORS as e:
+        logger.error(f"SIM status lookup failed: {e}")
+        return SimRecord(msisdn, False, message=_upstream_failure_message(e), transient=True)
+    except httpx.HTTPError as e:
+        logger.error(f"Error during request: {e}")
+        return SimRecord(msisdn, False, message=f"Request Error: {e}")
+
+    data = response.json()
+    if data.get("status"):
+        iccid = data["data"].get("iccid", "")
+        last_4_iccid = iccid[-4:] if iccid else "Tidak diketahui"
+        return SimRecord(
+            msisdn, True,
+            card_status=data["data"].get("cardStatus", "Tidak diketahui"),
+            activation_status=data["data"].get("activationStatus", "Tidak diketahui"),
+            last_4_iccid=last_4_iccid,
+        )
+    return SimRecord(msisdn, False, message=data.get("message", "Tidak diketahui"))
@@ -0,0 +1,230 @@
+import csv
+import json
+import logging
+import os
+import time
+import uuid
+from itertools import islice
+from core.config import CHECKPOINT_INTERVAL, JOB_DIR
+from core.results import KINDS, RECORD_TYPES, REJECTED, TEXT_COLUMNS, RecordColumns, output_filename
+
+logger = logging.getLogger(__name__)
+
+# Each writer appends one record at a time and flushes, so a job that dies
+# midway still leaves a usable file with every row finished so far. Rows
+# refused by input validation are held back and written as a separate
+# "Ditolak" section when the file is closed.
+class RecordWriter:
+    def __init__(self, kind):
+        self._rejected_columns, self._to_rejected_row = REJECTED[kind]
+        # A badly formatted upload can reject most of its rows, so they are held columnar
+        self._rejected = RecordColumns(kind)
+
+    def write(self, record):
+        if record.rejected:
+            self._rejected.append(record)
+        else:
+            self._write(record)
+
+    def close(self):
+        if self._rejected:
+            rows = (self._to_rejected_row(record) for record in self._rejected)
+            self._write_rejected(self._rejected_columns, rows, len(self._rejected))
+        self._close()
+
+class CsvWriter(RecordWriter):
+    def __init__(self, filename, kind):
+        super().__init__(kind)
+        columns, self._to_row, _ = KINDS[kind]
+        self._file = open(filename, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def _write(self, record):
+        self._writer.writerow(self._to_row(record))
+        self._file.flush()
+
+    def _write_rejected(self, columns, rows, count):
+        self._writer.writerows([[], [f"Ditolak ({count} baris)"], columns])
+        self._writer.writerows(rows)
+
+    def _close(self):
+        self._file.close()
+
+class TxtWriter(RecordWriter):
+    def __init__(self, filename, kind):
+        super().__init__(kind)
+        _, _, self._to_line = KINDS[kind]
+        self._file = open(filename, "w", encoding="utf-8")
+
+    def _write(self, record):
+        self._file.write(self._to_line(record))
+        self._file.flush()
+
+    def _write_rejected(self, columns, rows, count):
+        self._file.write(f"\nDitolak ({count} baris):\n")
+        self._file.writelines(" | ".join(row) + "\n" for row in rows)
+
+    def _close(self):
+        self._file.close()
+
+# Write-only openpyxl workbook: rows are serialized as they arrive instead of
+# being collected into a DataFrame, and identifier columns are typed as text.
+# Rejected rows go to a second "Ditolak" sheet.
+class ExcelWriter(RecordWriter):
+    def __init__(self, filename, kind):
+        super().__init__(kind)
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        self._cell = WriteOnlyCell
+        columns, self._to_row, _ = KINDS[kind]
+        self._text_columns = TEXT_COLUMNS[kind]
+        self._filename = filename
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Sheet1")
+        self._sheet.append(columns)
+
+    def _text_cell(self, sheet, value):
+        cell = self._cell(sheet, value=str(value))
+        cell.number_format = "@"
+        return cell
+
+    def _write(self, record):
+        row = self._to_row(record)
+        for index in self._text_columns:
+            row[index] = self._text_cell(self._sheet, row[index])
+        self._sheet.append(row)
+
+    def _write_rejected(self, columns, rows, count):
+        sheet = self._workbook.create_sheet("Ditolak")
+        sheet.append(columns)
+        for row in rows:
+            sheet.append([self._text_cell(sheet, value) for value in row])
+
+    def _close(self):
+        self._workbook.save(self._filename)
+
+WRITERS = {"csv": CsvWriter, "txt": TxtWriter, "excel": ExcelWriter}
+
+# Append-only JSON-lines copy of a job's records, used to render further
+# output formats later without repeating the lookups or keeping rows in memory.
+# Rows are in input order, so the spool doubles as the job's checkpoint: an
+# interrupted job reopens it and skips the rows it already holds. Writes are
+# buffered and flushed every CHECKPOINT_INTERVAL seconds.
+class ResultSpool:
+    def __init__(self, path, kind=None):
+        self.path = path
+        self.kind = kind
+        self.resumed = self._trim() if os.path.exists(path) else 0
+        self._file = open(path, "a", encoding="utf-8")
+        self._flushed_at = time.monotonic()
+
+    @classmethod
+    def new(cls, prefix, kind=None):
+        os.makedirs(JOB_DIR, exist_ok=True)
+        return cls(os.path.join(JOB_DIR, f"{prefix}_{uuid.uuid4().hex}.jsonl"), kind)
+
+    # Function to reopen the spool an interrupted run of a job left behind, or start a new one
+    @classmethod
+    def for_job(cls, job, prefix, kind):
+        if job.spool and os.path.exists(job.spool):
+            spool = cls(job.spool, kind)
+            logger.info(f"Resuming job {job.id} after {spool.resumed} finished rows")
+            return spool
+        return cls.new(prefix, kind)
+
+    # Drop a torn final line and count the complete ones
+    def _trim(self):
+        with open(self.path, "rb+") as file:
+            data = file.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                file.truncate(end)
+        return data.count(b"\n", 0, end)
+
+    # Records finished before the spool was reopened
+    def finished(self):
+        if not self.resumed:
+            return iter(())
+        return islice(read_spool(self.path, self.kind), self.resumed)
+
+    def write(self, record):
+        self._file.write(json.dumps(record.to_json()) + "\n")
+        if time.monotonic() - self._flushed_at >= CHECKPOINT_INTERVAL:
+            self._file.flush()
+            self._flushed_at = time.monotonic()
+
+    def close(self):
+        self._file.close()
+
+# Function to read records of a kind back from a spool, ignoring a torn final line
+def read_spool(path, kind):
+    record_type = RECORD_TYPES[kind]
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                yield record_type.from_json(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping incomplete record in {path}")
+
+# Function to remove a job spool that is no longer needed
+def discard_spool(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+# Function to send a rendered result file with `send` (bot.send_document or
+# message.reply_document) under its own name, then remove it
+async def send_output(send, path, **kwargs):
+    try:
+        with open(path, "rb") as file:
+            return await send(document=file, filename=os.path.basename(path), **kwargs)
+    finally:
+        os.remove(path)
+
+# Function to write records (any iterable) in the chosen format
+def render_results(records, kind, output_format, filename=None, prefix="processed"):
+    filename = filename or output_filename(prefix, output_format)
+    writer = WRITERS[output_format](filename, kind)
+    count = 0
+    try:
+        for record in records:
+            writer.write(record)
+            count += 1
+    finally:
+        writer.close()
+    logger.info(f"Rendered {count} {kind} records to {filename}")
+    return filename
+
+# Function to write records from a running lookup as each one completes,
+# optionally teeing them into a spool for later re-rendering
+async def write_job(records, kind, output_format, prefix="processed", spool=None, progress=None):
+    filename = output_filename(prefix, output_format)
+    writer = WRITERS[output_format](filename, kind)
+    count = 0
+    completed = False
+    if progress is not None:
+        await progress.start()
+    try:
+        # Rows a resumed job finished before the restart come straight from its spool
+        if spool is not None:
+            for record in spool.finished():
+                writer.write(record)
+                if progress is not None:
+                    progress.advance()
+                count += 1
+        async for record in records:
+            writer.write(record)
+            if spool is not None:
+                spool.write(record)
+            if progress is not None:
+                progress.advance()
+            count += 1
+        completed = True
+    finally:
+        writer.close()
+        if spool is not None:
+            spool.close()
+        if progress is not None:
+            await progress.finish(completed)
+    logger.info(f"Wrote {count} {kind} records to {filename}")
+    return filename
@@ -1,13 +1,31 @@
+import time
+STARTED_AT = time.perf_counter()  # Measured before the heavy imports below
+
+import asyncio
 import os
-import csv
-import requests
-from datetime import datetime
+import sys
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 import logging
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
-import pandas as pd
+
+# Allow running this script directly from model/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.bulk import BatchStats, check_sim_batch, iter_nik_records, iter_sim_records
+from core.cache import close_cache
+from core.delta import load_delta, previous_source
+from core.jobs import bulk_jobs, job_cancel, job_status, job_type, submit_job
+from core.metrics import log_startup
+from core.normalize import check_nik_pair, msisdns_from_text
+from core.progress import JobProgress, handle_partial_request
+from core.runner import run_bot
+from core.results import sim_line
+from core.session import SessionTooLarge, load_session, save_session
+from core.state import close_state
+from core.sheets import stream_msisdns, stream_nik_pairs
+from core.writers import ResultSpool, read_spool, render_results, send_output, write_job
+from core.upstream import check_nik_kk, close_clients
+from core.uploads import upload_handlers
 
 # Load environment variables
 load_dotenv()
@@ -23,129 +41,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# URLs for NIK/KK checking
-NIK_URL_POST = "https://myim3.indosatooredoo.com/ceknomor/checkForm"
-NIK_URL_RESULT = "https://myim3.indosatooredoo.com/ceknomor/result"
-
-# URL for SIM status checking
-SIM_STATUS_URL = "https://tri.co.id/api/v1/information/sim-status"
-
-# Function to check NIK/KK
-def check_nik_kk(nik, kk):
-    headers = {
-        "Host": "myim3.indosatooredoo.com",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.6778.140 Safari/537.36",
-        "Origin": "https://myim3.indosatooredoo.com",
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "Referer": "https://myim3.indosatooredoo.com/ceknomor/",
-    }
-
-    payload = {
-        "nik": nik,
-        "kk": kk,
-        "g-recaptcha-response": "",
-        "send": "PERIKSA"
-    }
-
-    # Kirim POST request tanpa mengikuti redirect secara otomatis
-    with requests.Session() as session:
-        post_response = session.post(NIK_URL_POST, headers=headers, data=payload, allow_redirects=False)
-
-        # Periksa apakah status code 302 (redirect)
-        if post_response.status_code == 302:
-            # Akses URL tujuan (result)
-            get_response = session.get(NIK_URL_RESULT, headers=headers)
-
-            if get_response.status_code == 200:
-                # Parse HTML hasil
-                soup = BeautifulSoup(get_response.text, "html.parser")
-                nik_result = soup.find("h6")
-                nomor_result = soup.find("ul", class_="list-unstyled margin-5-top")
-
-                if nik_result and nomor_result:
-                    # Mengambil nomor yang ditemukan
-                    nomor_list = nomor_result.find_all("li")
-                    nomor = [nomor.text.strip() for nomor in nomor_list]
-                    
-                    # Menghitung sisa berdasarkan jumlah nomor yang ditemukan
-                    sisa = 3 - len(nomor)
-
-                    return {
-                        "status": True,
-                        "nik": nik_result.text.strip(),
-                        "nomor": nomor,
-                        "sisa": sisa
-                    }
-                else:
-                    return {
-                        "status": False,
-                        "message": "Data tidak ditemukan atau format respons berubah.",
-                        "sisa": 3
-                    }
-            else:
-                return {
-                    "status": False,
-                    "message": f"GET request failed with status code {get_response.status_code}",
-                    "sisa": 3
-                }
-        else:
-            return {
-                "status": False,
-                "message": f"POST request failed with status code {post_response.status_code}",
-                "sisa": 3
-            }
-
-# Function to check SIM status
-def check_sim_status(msisdn):
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.6778.140 Safari/537.36",
-        "Origin": "https://tri.co.id",
-        "Referer": "https://tri.co.id/",
-    }
-
-    payload = {
-        "action": "MSISDN_STATUS_WEB",
-        "input1": "",
-        "input2": "",
-        "language": "ID",
-        "msisdn": msisdn
-    }
-
-    try:
-        response = requests.post(SIM_STATUS_URL, headers=headers, json=payload, timeout=10)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error during request: {e}")
-        return {
-            "status": False,
-            "message": f"Request Error: {e}"
-        }
-
-    if response.status_code == 200:
-        data = response.json()
-        if data.get("status"):
-            iccid = data["data"].get("iccid", "")
-            last_4_iccid = iccid[-4:] if iccid else "Tidak diketahui"
-            return {
-                "status": True,
-                "card_status": data["data"].get("cardStatus", "Tidak diketahui"),
-                "activation_status": data["data"].get("activationStatus", "Tidak diketahui"),
-                "last_4_iccid": last_4_iccid,
-            }
-        else:
-            return {
-                "status": False,
-                "message": data.get("message", "Tidak diketahui")
-            }
-    else:
-        return {
-            "status": False,
-            "message": f"HTTP Error {response.status_code}"
-        }
-
 # Command handler for /ceknik
 async def cek_nik(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
@@ -153,59 +48,33 @@ async def cek_nik(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Format salah. Gunakan: /ceknik <NIK> <KK>")
         return
 
-    nik, kk = args[0], args[1]
-    result = check_nik_kk(nik, kk)
-    if result["status"]:
-        nomor_list = "\n".join(result["nomor"])
+    # NIK/KK yang formatnya salah tidak perlu dikirim ke server
+    nik, kk, reason = check_nik_pair(args[0], args[1])
+    if reason:
+        await update.message.reply_text(f"Gagal: {reason}")
+        return
+
+    result = await check_nik_kk(nik, kk)
+    if result.status:
+        nomor_list = "\n".join(result.nomor)
         await update.message.reply_text(
-            f"NIK: {nik}\nNomor: {nomor_list}\nSisa: {result['sisa']}"
+            f"NIK: {nik}\nNomor: {nomor_list}\nSisa: {result.sisa}"
         )
     else:
-        await update.message.reply_text(f"Gagal: {result['message']}")
+        await update.message.reply_text(f"Gagal: {result.message}")
+
 # Fungsi untuk memproses spreadsheet dari URL
-async def ceknik_process_spreadsheet_from_url(url):
-    response = requests.get(url)
-    response.raise_for_status()
-
-    # Parsing CSV
-    data = response.text.splitlines()
-    reader = csv.reader(data)
-    next(reader, None)  # Skip header
-
-    results = [["NIK", "KK", "Status", "Nomor", "Message", "Sisa"]]
-
-    for row in reader:
-        nik, kk = row[0], row[1]
-        result = check_nik_kk(nik, kk)  # Asumsikan check_nik_kk didefinisikan dengan benar
-
-        if result["status"]:
-            results.append([nik, kk, "Berhasil", ", ".join(result["nomor"]), "", result["sisa"]])
-        else:
-            results.append([nik, kk, "Gagal", "", result["message"], result["sisa"]])
-
-    return results
-
-# Fungsi untuk menyimpan hasil ke file
-async def ceknik_save_results(results, output_format):
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-    if output_format == "csv":
-        filename = f"results_{timestamp}.csv"
-        with open(filename, "w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerows(results)
-    elif output_format == "txt":
-        filename = f"results_{timestamp}.txt"
-        with open(filename, "w") as file:
-            for row in results:
-                file.write(" | ".join(row) + "\n")
-    elif output_format == "excel":
-        import pandas as pd
-        filename = f"results_{timestamp}.xlsx"
-        df = pd.DataFrame(results, columns=["NIK", "KK", "Status", "Nomor", "Message", "Sisa"])
-        df.to_excel(filename, index=False)
-
-    return filename
+def ceknik_process_spreadsheet_from_url(url, stats=None, carry=None):
+    # Rows are parsed and checked while the CSV export is still downloading
+    return iter_nik_records(stream_nik_pairs(url), stats=stats, carry=carry)
+
+# Tombol pilihan format output, prefix membedakan job NIK/KK dari job MSISDN
+def format_keyboard(prefix=""):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("CSV", callback_data=f"{prefix}csv"),
+         InlineKeyboardButton("TXT", callback_data=f"{prefix}txt"),
+         InlineKeyboardButton("Excel", callback_data=f"{prefix}excel")]
+    ])
 
 # Fungsi untuk menangani perintah /url
 async def ceknik_handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -219,19 +88,26 @@ async def ceknik_handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Contoh: `/url https://docs.google.com/spreadsheets/d/1Rbyn4y9xyBnUAyR1bDid6QMmGqx1ltOY02fBS6mfJGI/export?format=csv&gid=1462660250`"
         )
         return
-    context.user_data['spreadsheet_url'] = user_input
-
-    # Kirimkan pilihan format output menggunakan tombol
-    keyboard = [
-        [InlineKeyboardButton("CSV", callback_data="csv"),
-         InlineKeyboardButton("TXT", callback_data="txt"),
-         InlineKeyboardButton("Excel", callback_data="excel")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    session = await load_session(update.effective_user.id)
+    session['spreadsheet_url'] = user_input
+    # Spool lama dibiarkan untuk sweep, agar job berikutnya masih bisa delta terhadapnya
+    session.pop('ceknik_spool', None)
+    await save_session(update.effective_user.id, session)
 
     await update.message.reply_text(
         "URL diterima. Pilih format output:",
-        reply_markup=reply_markup
+        reply_markup=format_keyboard("ceknik:")
+    )
+
+# Fungsi untuk mengirim file hasil NIK/KK dan menawarkan format lain
+async def ceknik_send_results(bot, chat_id, filename, summary):
+    await send_output(bot.send_document, filename, chat_id=chat_id)
+
+    await bot.send_message(
+        chat_id,
+        f"Proses selesai: {summary}. File telah dikirimkan.\n"
+        "Pilih format lain jika diperlukan:",
+        reply_markup=format_keyboard("ceknik:")
     )
 
 # Fungsi untuk menangani pilihan format output
@@ -239,194 +115,149 @@ async def ceknik_handle_format_choice(update: Update, context: ContextTypes.DEFA
     query = update.callback_query
     await query.answer()
 
-    output_format = query.data
-    spreadsheet_url = context.user_data.get('spreadsheet_url')
+    output_format = query.data.removeprefix("ceknik:")
+    session = await load_session(update.effective_user.id)
+    spreadsheet_url = session.get('spreadsheet_url')
 
     if not spreadsheet_url:
         await query.edit_message_text("URL spreadsheet tidak ditemukan. Silakan ulangi proses.")
         return
 
-    try:
-        await query.edit_message_text("Sedang memproses... Mohon tunggu.")
-
-        results = await process_spreadsheet_from_url(spreadsheet_url)
-        filename = await save_results(results, output_format)
+    # Other formats are rendered from the finished job's spool
+    spool_path = session.get('ceknik_spool')
+    if spool_path is not None:
+        try:
+            filename = await asyncio.to_thread(render_results, read_spool(spool_path, "nik"), "nik", output_format,
+                                               prefix="results")
+            await ceknik_send_results(context.bot, query.message.chat_id, filename, session.get('ceknik_summary', ''))
+        except Exception as e:
+            logger.error(f"Error: {e}")
+            await query.message.reply_text(f"Terjadi kesalahan: {e}")
+        return
 
-        with open(filename, "rb") as file:
-            await query.message.reply_document(file, filename=filename)
+    await query.edit_message_reply_markup(reply_markup=None)
+    await submit_job(query.message, update.effective_user.id, "cek NIK/KK spreadsheet", "ceknik_sheet",
+                     {"url": spreadsheet_url, "output_format": output_format})
 
-        await query.message.reply_text("Proses selesai. File telah dikirimkan.")
+# Bulk job: the sheet is checked once and rows are written as they finish
+@job_type("ceknik_sheet")
+async def ceknik_sheet_job(job, bot):
+    spreadsheet_url, output_format = job.params["url"], job.params["output_format"]
+    try:
+        status_message = await bot.send_message(job.chat_id, f"Job {job.id}: sedang memproses... Mohon tunggu.")
+        spool = ResultSpool.for_job(job, "ceknik", "nik")
+        stats = BatchStats(spool)
+        job.spool, job.kind, job.output_format = spool.path, "nik", output_format
+        job.progress = JobProgress(status_message, "nik", output_format, spool=spool, job_id=job.id)
+        await bulk_jobs.save(job)
+        filename = await write_job(ceknik_process_spreadsheet_from_url(spreadsheet_url, stats), "nik",
+                                   output_format, prefix="results", spool=spool, progress=job.progress)
+        job.summary = stats.summary()
+        # Offer the other formats only if no new URL was sent while the job ran;
+        # the spool stays either way for delta re-checks against this job
+        session = await load_session(job.user_id)
+        if session.get('spreadsheet_url') == spreadsheet_url:
+            session['ceknik_spool'] = spool.path
+            session['ceknik_summary'] = stats.summary()
+            await save_session(job.user_id, session)
+        await ceknik_send_results(bot, job.chat_id, filename, stats.summary())
     except Exception as e:
         logger.error(f"Error: {e}")
-        await query.message.reply_text(f"Terjadi kesalahan: {e}")
+        await bot.send_message(job.chat_id, f"Terjadi kesalahan: {e}")
+        raise
 
 # Command handler for /cekstatus
 async def cek_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    results = []
-    msisdns = text_data.strip().split("\n")
-    for msisdn in msisdns:
-        msisdn = msisdn.strip()
-        if msisdn.startswith("08"):
-            msisdn = "628" + msisdn[2:]
+    # "-f" melewati cache dan memaksa cek ulang ke server
+    use_cache = "-f" not in context.args
+    args = [arg for arg in context.args if arg != "-f"]
+    if not args:
+        await update.message.reply_text("Format salah. Gunakan: /cekstatus [-f] <MSISDN1> [MSISDN2] ...")
+        return
 
-        logger.info(f"Processing MSISDN: {msisdn}")
-        result = check_sim_status(msisdn)
+    records = await check_sim_batch(msisdns_from_text("\n".join(args)), use_cache=use_cache)
+    await update.message.reply_text("".join(sim_line(record) for record in records))
 
-        if result["status"]:
-            results.append(f"MSISDN: {msisdn} | Card Status: {result['card_status']} | Activation Status: {result['activation_status']} | Last 4 ICCID: {result['last_4_iccid']}\n")
-        else:
-            results.append(f"MSISDN: {msisdn} | Message: {result['message']}\n")
+# Function to read "<URL> [ID job sebelumnya]" for /urlceknik and /urlcekstatus.
+# An earlier job ID, or replying to an earlier result file, turns on delta mode.
+def sheet_job_params(update, args):
+    params = {"url": args[0]}
+    previous = previous_source(update.message, args[1] if len(args) > 1 else None)
+    if previous is not None:
+        params["previous"] = previous
+    return params
 
 # Command handler for /urlceknik
 async def url_cek_nik(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if not args or not args[0].startswith("https://"):
-        await update.message.reply_text("URL tidak valid. Harap gunakan format URL yang valid.")
+        await update.message.reply_text(
+            "URL tidak valid. Gunakan: /urlceknik <URL> [ID job sebelumnya], "
+            "atau balas file hasil sebelumnya untuk hanya mengecek baris baru, gagal, atau yang sudah lama."
+        )
         return
 
-    url = args[0]
-    response = requests.get(url)
-    response.raise_for_status()
-
-    csv_data = response.text.splitlines()
-    reader = csv.reader(csv_data)
-    next(reader, None)
-
-    results = []
-    for row in reader:
-        nik = row[0]
-        kk = row[1]
-        result = check_nik_kk(nik, kk)
-        if result["status"]:
-            results.append([nik, kk, ", ".join(result["nomor"]), result["sisa"]])
-        else:
-            results.append([nik, kk, "Gagal", result["message"]])
-
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_file = f"ceknik_{timestamp}.csv"
-    with open(output_file, "w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["NIK", "KK", "Nomor", "Sisa"])
-        writer.writerows(results)
-
-    with open(output_file, "rb") as file:
-        await update.message.reply_document(file, filename=output_file)
+    params = sheet_job_params(update, args)
+    description = "cek NIK/KK spreadsheet (delta)" if "previous" in params else "cek NIK/KK spreadsheet"
+    await submit_job(update.message, update.effective_user.id, description, "urlceknik", params)
+
+# Job bulk untuk /urlceknik: hasil dikirim sebagai CSV ke chat asal
+@job_type("urlceknik")
+async def url_cek_nik_job(job, bot):
+    url = job.params["url"]
+    carry, status_text = await load_delta(job, bot, "nik")
+    status_message = await bot.send_message(job.chat_id, status_text)
+    spool = ResultSpool.for_job(job, "ceknik", "nik")
+    stats = BatchStats(spool, carry)
+    job.spool, job.kind, job.output_format = spool.path, "nik", "csv"
+    job.progress = JobProgress(status_message, "nik", "csv", spool=spool, job_id=job.id)
+    await bulk_jobs.save(job)
+    # Spool disimpan untuk mode delta berikutnya
+    output_file = await write_job(ceknik_process_spreadsheet_from_url(url, stats, carry), "nik", "csv", prefix="ceknik",
+                                  spool=spool, progress=job.progress)
+
+    job.summary = stats.summary()
+    await send_output(bot.send_document, output_file, chat_id=job.chat_id)
+    await bot.send_message(job.chat_id, f"Proses selesai: {stats.summary()}.")
 
 # Command handler for /urlcekstatus
 async def url_cek_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if not args or not args[0].startswith("https://"):
-        await update.message.reply_text("URL tidak valid. Harap gunakan format URL yang valid.")
+        await update.message.reply_text(
+            "URL tidak valid. Gunakan: /urlcekstatus <URL> [ID job sebelumnya], "
+            "atau balas file hasil sebelumnya untuk hanya mengecek baris baru, gagal, atau yang sudah lama."
+        )
         return
 
-    url = args[0]
-    response = requests.get(url)
-    response.raise_for_status()
-
-    csv_data = response.text.splitlines()
-    reader = csv.reader(csv_data)
-    next(reader, None)
-
-    results = []
-    for row in reader:
-        msisdn = row[0]
-        result = check_sim_status(msisdn)
-        if result["status"]:
-            results.append([msisdn, result["card_status"], result["activation_status"], result["last_4_iccid"]])
-        else:
-            results.append([msisdn, "Gagal", result["message"]])
-
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_file = f"cekstatus_{timestamp}.csv"
-    with open(output_file, "w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(["MSISDN", "Card Status", "Activation Status", "Last 4 ICCID"])
-        writer.writerows(results)
-
-    with open(output_file, "rb") as file:
-        await update.message.reply_document(file, filename=output_file)
-        
-# Fungsi untuk membaca input dari textarea dan menyimpan ke CSV
-def cekstatus_read_from_textarea_csv(text_data):
-    results = [["MSISDN", "Card Status", "Activation Status", "Last 4 ICCID", "Message"]]
-
-    msisdns = text_data.strip().split("\n")
-    for msisdn in msisdns:
-        msisdn = msisdn.strip()
-        if msisdn.startswith("08"):
-            msisdn = "628" + msisdn[2:]
-
-        logger.info(f"Processing MSISDN: {msisdn}")
-        result = check_sim_status(msisdn)
-
-        if result["status"]:
-            results.append([msisdn, result["card_status"], result["activation_status"], result["last_4_iccid"], ""])
-        else:
-            results.append([msisdn, "", "", "", result["message"]])
-
-    # Simpan hasil ke file CSV
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_filename_csv = f"processed_{timestamp}.csv"
-    with open(output_filename_csv, "w", newline="") as output_file:
-        writer = csv.writer(output_file)
-        writer.writerows(results)
-
-    logger.info(f"Processing completed. Output saved to {output_filename_csv}")
-    return output_filename_csv
-
-# Fungsi untuk membaca input dari textarea dan menyimpan ke TXT
-def cekstatus_read_from_textarea_txt(text_data):
-    results = []
-    msisdns = text_data.strip().split("\n")
-    for msisdn in msisdns:
-        msisdn = msisdn.strip()
-        if msisdn.startswith("08"):
-            msisdn = "628" + msisdn[2:]
-
-        logger.info(f"Processing MSISDN: {msisdn}")
-        result = check_sim_status(msisdn)
-
-        if result["status"]:
-            results.append(f"MSISDN: {msisdn} | Card Status: {result['card_status']} | Activation Status: {result['activation_status']} | Last 4 ICCID: {result['last_4_iccid']}\n")
-        else:
-            results.append(f"MSISDN: {msisdn} | Message: {result['message']}\n")
-
-    # Simpan hasil ke file TXT
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_filename_txt = f"processed_{timestamp}.txt"
-    with open(output_filename_txt, "w") as output_file:
-        output_file.writelines(results)
-
-    logger.info(f"Processing completed. Output saved to {output_filename_txt}")
-    return output_filename_txt
-
-# Fungsi untuk membaca input dari textarea dan menyimpan ke Excel
-def cekstatus_read_from_textarea_excel(text_data):
-    import pandas as pd
-    results = []
-
-    msisdns = text_data.strip().split("\n")
-    for msisdn in msisdns:
-        msisdn = msisdn.strip()
-        if msisdn.startswith("08"):
-            msisdn = "628" + msisdn[2:]
-
-        logger.info(f"Processing MSISDN: {msisdn}")
-        result = check_sim_status(msisdn)
-
-        if result["status"]:
-            results.append([msisdn, result["card_status"], result["activation_status"], result["last_4_iccid"], ""])
-        else:
-            results.append([msisdn, "", "", "", result["message"]])
-
-    # Simpan hasil ke file Excel
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_filename_excel = f"processed_{timestamp}.xlsx"
-    df = pd.DataFrame(results, columns=["MSISDN", "Card Status", "Activation Status", "Last 4 ICCID", "Message"])
-    df.to_excel(output_filename_excel, index=False)
-
-    logger.info(f"Processing completed. Output saved to {output_filename_excel}")
-    return output_filename_excel
+    params = sheet_job_params(update, args)
+    description = "cek status spreadsheet (delta)" if "previous" in params else "cek status spreadsheet"
+    await submit_job(update.message, update.effective_user.id, description, "urlcekstatus", params)
+
+# Job bulk untuk /urlcekstatus: hasil dikirim sebagai CSV ke chat asal
+@job_type("urlcekstatus")
+async def url_cek_status_job(job, bot):
+    url = job.params["url"]
+    carry, status_text = await load_delta(job, bot, "sim")
+    status_message = await bot.send_message(job.chat_id, status_text)
+    spool = ResultSpool.for_job(job, "cekstatus", "sim")
+    stats = BatchStats(spool, carry)
+    job.spool, job.kind, job.output_format = spool.path, "sim", "csv"
+    job.progress = JobProgress(status_message, "sim", "csv", spool=spool, job_id=job.id)
+    await bulk_jobs.save(job)
+    # Spool disimpan untuk mode delta berikutnya
+    output_file = await write_job(iter_sim_records(stream_msisdns(url), stats=stats, carry=carry), "sim", "csv",
+                                  prefix="cekstatus", spool=spool, progress=job.progress)
+
+    job.summary = stats.summary()
+    await send_output(bot.send_document, output_file, chat_id=job.chat_id)
+    await bot.send_message(job.chat_id, f"Proses selesai: {stats.summary()}.")
+
+# Fungsi untuk mengecek semua MSISDN dari textarea satu kali per job
+def cekstatus_read_from_textarea(text_data, stats=None):
+    msisdns = msisdns_from_text(text_data)
+    logger.info(f"Processing {len(msisdns)} MSISDN")
+    return iter_sim_records(msisdns, stats=stats)
 
 async def handle_textarea(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text_data = update.message.text.strip()
@@ -438,24 +269,35 @@ async def handle_textarea(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         logger.info(f"User {update.effective_user.id} input MSISDN data via textarea.")
         
+        # Simpan data yang dikirim pengguna untuk pemrosesan selanjutnya,
+        # hasil job sebelumnya tidak berlaku lagi untuk data baru (spool-nya dibiarkan untuk sweep)
+        session = await load_session(update.effective_user.id)
+        session['text_data'] = text_data
+        session.pop('job_spool', None)
+        await save_session(update.effective_user.id, session)
+
         # Kirimkan pilihan format output menggunakan inline keyboard
-        keyboard = [
-            [InlineKeyboardButton("CSV", callback_data="csv"),
-             InlineKeyboardButton("TXT", callback_data="txt"),
-             InlineKeyboardButton("Excel", callback_data="excel")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
             "Pilih format output yang diinginkan:",
-            reply_markup=reply_markup
+            reply_markup=format_keyboard()
         )
-
-        # Simpan data yang dikirim pengguna untuk pemrosesan selanjutnya
-        context.user_data['text_data'] = text_data
+    except SessionTooLarge as e:
+        await update.message.reply_text(str(e))
     except Exception as e:
         logger.error(f"Error during textarea processing: {e}")
         await update.message.reply_text(f"Terjadi kesalahan: {e}")
 
+async def send_results(bot, chat_id, output_filename, summary):
+    # Kirimkan file hasil kepada pengguna
+    await send_output(bot.send_document, output_filename, chat_id=chat_id)
+
+    await bot.send_message(
+        chat_id,
+        f"Proses selesai! {summary}. File hasil telah dikirimkan.\n"
+        "Pilih format lain jika diperlukan:",
+        reply_markup=format_keyboard()
+    )
+
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()  # Pastikan kita menunggu eksekusi dari query.answer()
@@ -463,35 +305,67 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Hapus tombol setelah pilihan dibuat
     await query.edit_message_reply_markup(reply_markup=None)  # Menghapus inline keyboard
 
-    # Ambil data yang sudah disimpan oleh bot
-    text_data = context.user_data.get('text_data', '')
+    # Ambil data yang sudah disimpan di sesi pengguna
+    session = await load_session(update.effective_user.id)
+    text_data = session.get('text_data', '')
 
     if not text_data:
         await query.message.reply_text("Data MSISDN tidak ditemukan.")
         return
 
     choice = query.data
+
+    # Format berikutnya dibuat dari spool job yang sudah selesai tanpa mengecek ulang
+    spool_path = session.get('job_spool')
+    if spool_path is not None:
+        try:
+            await query.message.reply_text(f"Anda memilih format output: {choice.upper()}.")
+            output_filename = await asyncio.to_thread(render_results, read_spool(spool_path, "sim"), "sim", choice)
+            await send_results(context.bot, query.message.chat_id, output_filename, session.get('job_summary', ''))
+        except Exception as e:
+            logger.error(f"Error during output processing: {e}")
+            await query.message.reply_text(f"Terjadi kesalahan: {e}")
+        return
+
+    await submit_job(query.message, update.effective_user.id, "cek status MSISDN", "cekstatus_text",
+                     {"text_data": text_data, "output_format": choice})
+
+# Job bulk: cek nomor hanya sekali; hasil ditulis per baris ke file dan spool
+@job_type("cekstatus_text")
+async def cekstatus_text_job(job, bot):
+    text_data, choice = job.params["text_data"], job.params["output_format"]
     try:
-        # Tampilkan konfirmasi bahwa pilihan sudah diterima
-        await query.message.reply_text(f"Anda memilih format output: {choice.upper()}.\nSedang memproses...")
-
-        # Proses sesuai dengan pilihan format
-        if choice == "csv":
-            output_filename = cekstatus_read_from_textarea_csv(text_data)
-        elif choice == "txt":
-            output_filename = cekstatus_read_from_textarea_txt(text_data)
-        elif choice == "excel":
-            output_filename = cekstatus_read_from_textarea_excel(text_data)
-
-        # Kirimkan file hasil kepada pengguna
-        with open(output_filename, "rb") as output_file:
-            await query.message.reply_document(output_file, filename=output_filename)
-
-        await query.message.reply_text("Proses selesai! File hasil telah dikirimkan.")
+        status_message = await bot.send_message(
+            job.chat_id, f"Job {job.id}: format output {choice.upper()}.\nSedang memproses..."
+        )
+        spool = ResultSpool.for_job(job, "cekstatus", "sim")
+        stats = BatchStats(spool)
+        job.spool, job.kind, job.output_format = spool.path, "sim", choice
+        job.progress = JobProgress(status_message, "sim", choice, spool=spool,
+                                   total=len(msisdns_from_text(text_data)), job_id=job.id)
+        await bulk_jobs.save(job)
+        output_filename = await write_job(cekstatus_read_from_textarea(text_data, stats), "sim", choice, spool=spool, progress=job.progress)
+        job.summary = stats.summary()
+        # Format lain hanya ditawarkan jika pengguna belum mengirim data baru selama job berjalan;
+        # spool tetap disimpan untuk delta dan dihapus oleh sweep
+        session = await load_session(job.user_id)
+        if session.get('text_data') == text_data:
+            session['job_spool'] = spool.path
+            session['job_summary'] = stats.summary()
+            await save_session(job.user_id, session)
+        await send_results(bot, job.chat_id, output_filename, stats.summary())
     except Exception as e:
         logger.error(f"Error during output processing: {e}")
-        await query.message.reply_text(f"Terjadi kesalahan: {e}")
+        await bot.send_message(job.chat_id, f"Terjadi kesalahan: {e}")
+        raise
+
 
+# Stop the bulk job workers before closing the upstream pools and shared state they use
+async def shutdown(application):
+    await bulk_jobs.stop()
+    await close_clients()
+    await close_cache()
+    await close_state()
 
 # Main function to run the bot
 def main():
@@ -499,7 +373,9 @@ def main():
     if not TOKEN:
         raise ValueError("Telegram bot token not found in environment variables.")
 
-    application = Application.builder().token(TOKEN).build()
+    # Updates are handled concurrently, so one long lookup does not hold up other chats
+    application = (Application.builder().token(TOKEN).concurrent_updates(True)
+                   .post_init(bulk_jobs.start).post_shutdown(shutdown).build())
 
     application.add_handler(CommandHandler("ceknik", cek_nik))
     application.add_handler(CommandHandler("cekstatus", cek_status))
@@ -508,10 +384,15 @@ def main():
     
     #perbarui fungsi ini untuk cekstatus Fungsi
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_textarea))  # Menangani input MSISDN
-    application.add_handler(CallbackQueryHandler(button))  # Menangani pilihan output format
+    application.add_handler(CallbackQueryHandler(button, pattern="^(csv|txt|excel)$"))  # Menangani pilihan output format
+    application.add_handler(CallbackQueryHandler(handle_partial_request, pattern="^partial:"))  # Kirim hasil sementara
+    application.add_handlers(upload_handlers())  # Menangani file CSV/XLSX yang diunggah
+    application.add_handler(CommandHandler("status", job_status))  # Status job bulk
+    application.add_handler(CommandHandler("cancel", job_cancel))  # Batalkan job bulk
 
     logger.info("Bot is starting...")
-    application.run_polling()
+    log_startup(STARTED_AT)
+    run_bot(application)
 
 if __name__ == "__main__":
     main()
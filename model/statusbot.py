@@ -1,12 +1,29 @@
-import csv
-import requests
-from datetime import datetime
+import time
+STARTED_AT = time.perf_counter()  # Measured before the heavy imports below
+
+import asyncio
+import sys
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 import os
 import logging
 from dotenv import load_dotenv
 
+# Allow running this script directly from model/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.bulk import BatchStats, iter_sim_records
+from core.cache import close_cache
+from core.jobs import bulk_jobs, job_cancel, job_status, job_type, submit_job
+from core.metrics import log_startup
+from core.normalize import msisdns_from_text
+from core.progress import JobProgress, handle_partial_request
+from core.runner import run_bot
+from core.session import SessionTooLarge, load_session, save_session
+from core.state import close_state
+from core.writers import ResultSpool, read_spool, render_results, send_output, write_job
+from core.upstream import close_clients
+from core.uploads import upload_handlers
+
 # Memuat file .env
 load_dotenv()
 
@@ -21,146 +38,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# URL endpoint untuk cek status kartu
-url = "https://tri.co.id/api/v1/information/sim-status"
-
-# Fungsi untuk cek status kartu dan aktivasi
-def check_sim_status(msisdn):
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.6778.140 Safari/537.36",
-        "Origin": "https://tri.co.id",
-        "Referer": "https://tri.co.id/",
-    }
-
-    payload = {
-        "action": "MSISDN_STATUS_WEB",
-        "input1": "",
-        "input2": "",
-        "language": "ID",
-        "msisdn": msisdn
-    }
+# Tombol pilihan format output
+def format_keyboard():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("CSV", callback_data="csv"),
+         InlineKeyboardButton("TXT", callback_data="txt"),
+         InlineKeyboardButton("Excel", callback_data="excel")]
+    ])
 
-    try:
-        response = requests.post(url, headers=headers, json=payload, timeout=10)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error during request: {e}")
-        return {
-            "status": False,
-            "message": f"Request Error: {e}"
-        }
-
-    if response.status_code == 200:
-        data = response.json()
-        if data.get("status"):
-            iccid = data["data"].get("iccid", "")
-            last_4_iccid = iccid[-4:] if iccid else "Tidak diketahui"
-            return {
-                "status": True,
-                "card_status": data["data"].get("cardStatus", "Tidak diketahui"),
-                "activation_status": data["data"].get("activationStatus", "Tidak diketahui"),
-                "last_4_iccid": last_4_iccid,
-            }
-        else:
-            return {
-                "status": False,
-                "message": data.get("message", "Tidak diketahui")
-            }
-    else:
-        return {
-            "status": False,
-            "message": f"HTTP Error {response.status_code}"
-        }
-
-# Fungsi untuk membaca input dari textarea dan menyimpan ke CSV
-def read_from_textarea_csv(text_data):
-    results = [["MSISDN", "Card Status", "Activation Status", "Last 4 ICCID", "Message"]]
-
-    msisdns = text_data.strip().split("\n")
-    for msisdn in msisdns:
-        msisdn = msisdn.strip()
-        if msisdn.startswith("08"):
-            msisdn = "628" + msisdn[2:]
-
-        logger.info(f"Processing MSISDN: {msisdn}")
-        result = check_sim_status(msisdn)
-
-        if result["status"]:
-            results.append([msisdn, result["card_status"], result["activation_status"], result["last_4_iccid"], ""])
-        else:
-            results.append([msisdn, "", "", "", result["message"]])
-
-    # Simpan hasil ke file CSV
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_filename_csv = f"processed_{timestamp}.csv"
-    with open(output_filename_csv, "w", newline="") as output_file:
-        writer = csv.writer(output_file)
-        writer.writerows(results)
-
-    logger.info(f"Processing completed. Output saved to {output_filename_csv}")
-    return output_filename_csv
-
-# Fungsi untuk membaca input dari textarea dan menyimpan ke TXT
-def read_from_textarea_txt(text_data):
-    results = []
-    msisdns = text_data.strip().split("\n")
-    for msisdn in msisdns:
-        msisdn = msisdn.strip()
-        if msisdn.startswith("08"):
-            msisdn = "628" + msisdn[2:]
-
-        logger.info(f"Processing MSISDN: {msisdn}")
-        result = check_sim_status(msisdn)
-
-        if result["status"]:
-            results.append(f"MSISDN: {msisdn} | Card Status: {result['card_status']} | Activation Status: {result['activation_status']} | Last 4 ICCID: {result['last_4_iccid']}\n")
-        else:
-            results.append(f"MSISDN: {msisdn} | Message: {result['message']}\n")
-
-    # Simpan hasil ke file TXT
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_filename_txt = f"processed_{timestamp}.txt"
-    with open(output_filename_txt, "w") as output_file:
-        output_file.writelines(results)
-
-    logger.info(f"Processing completed. Output saved to {output_filename_txt}")
-    return output_filename_txt
-
-# Fungsi untuk membaca input dari textarea dan menyimpan ke Excel
-def read_from_textarea_excel(text_data):
-    import pandas as pd
-    results = []
-
-    msisdns = text_data.strip().split("\n")
-    for msisdn in msisdns:
-        msisdn = msisdn.strip()
-        if msisdn.startswith("08"):
-            msisdn = "628" + msisdn[2:]
-
-        logger.info(f"Processing MSISDN: {msisdn}")
-        result = check_sim_status(msisdn)
-
-        if result["status"]:
-            results.append([msisdn, result["card_status"], result["activation_status"], result["last_4_iccid"], ""])
-        else:
-            results.append([msisdn, "", "", "", result["message"]])
-
-    # Simpan hasil ke file Excel
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_filename_excel = f"processed_{timestamp}.xlsx"
-    df = pd.DataFrame(results, columns=["MSISDN", "Card Status", "Activation Status", "Last 4 ICCID", "Message"])
-    df.to_excel(output_filename_excel, index=False)
-
-    logger.info(f"Processing completed. Output saved to {output_filename_excel}")
-    return output_filename_excel
+# Fungsi untuk mengecek semua MSISDN dari textarea satu kali per job
+def read_from_textarea(text_data, stats=None):
+    msisdns = msisdns_from_text(text_data)
+    logger.info(f"Processing {len(msisdns)} MSISDN")
+    return iter_sim_records(msisdns, stats=stats)
 
 # Handler untuk perintah /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"User {update.effective_user.id} started the bot.")
     await update.message.reply_text(
-        "Halo! Kirimkan MSISDN (pisahkan dengan enter) atau unggah file CSV untuk diproses."
+        "Halo! Kirimkan MSISDN (pisahkan dengan enter) atau unggah file CSV/XLSX untuk diproses.\n"
+        "Gunakan /status [ID] untuk melihat job dan /cancel <ID> untuk membatalkannya."
     )
 
 # Handler untuk input MSISDN dari pengguna
@@ -174,24 +71,35 @@ async def handle_textarea(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         logger.info(f"User {update.effective_user.id} input MSISDN data via textarea.")
         
+        # Simpan data yang dikirim pengguna untuk pemrosesan selanjutnya,
+        # hasil job sebelumnya tidak berlaku lagi untuk data baru (spool-nya dibiarkan untuk sweep)
+        session = await load_session(update.effective_user.id)
+        session['text_data'] = text_data
+        session.pop('job_spool', None)
+        await save_session(update.effective_user.id, session)
+
         # Kirimkan pilihan format output menggunakan inline keyboard
-        keyboard = [
-            [InlineKeyboardButton("CSV", callback_data="csv"),
-             InlineKeyboardButton("TXT", callback_data="txt"),
-             InlineKeyboardButton("Excel", callback_data="excel")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
             "Pilih format output yang diinginkan:",
-            reply_markup=reply_markup
+            reply_markup=format_keyboard()
         )
-
-        # Simpan data yang dikirim pengguna untuk pemrosesan selanjutnya
-        context.user_data['text_data'] = text_data
+    except SessionTooLarge as e:
+        await update.message.reply_text(str(e))
     except Exception as e:
         logger.error(f"Error during textarea processing: {e}")
         await update.message.reply_text(f"Terjadi kesalahan: {e}")
 
+async def send_results(bot, chat_id, output_filename, summary):
+    # Kirimkan file hasil kepada pengguna
+    await send_output(bot.send_document, output_filename, chat_id=chat_id)
+
+    await bot.send_message(
+        chat_id,
+        f"Proses selesai! {summary}. File hasil telah dikirimkan.\n"
+        "Pilih format lain jika diperlukan:",
+        reply_markup=format_keyboard()
+    )
+
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()  # Pastikan kita menunggu eksekusi dari query.answer()
@@ -199,35 +107,67 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Hapus tombol setelah pilihan dibuat
     await query.edit_message_reply_markup(reply_markup=None)  # Menghapus inline keyboard
 
-    # Ambil data yang sudah disimpan oleh bot
-    text_data = context.user_data.get('text_data', '')
+    # Ambil data yang sudah disimpan di sesi pengguna
+    session = await load_session(update.effective_user.id)
+    text_data = session.get('text_data', '')
 
     if not text_data:
         await query.message.reply_text("Data MSISDN tidak ditemukan.")
         return
 
     choice = query.data
+
+    # Format berikutnya dibuat dari spool job yang sudah selesai tanpa mengecek ulang
+    spool_path = session.get('job_spool')
+    if spool_path is not None:
+        try:
+            await query.message.reply_text(f"Anda memilih format output: {choice.upper()}.")
+            output_filename = await asyncio.to_thread(render_results, read_spool(spool_path, "sim"), "sim", choice)
+            await send_results(context.bot, query.message.chat_id, output_filename, session.get('job_summary', ''))
+        except Exception as e:
+            logger.error(f"Error during output processing: {e}")
+            await query.message.reply_text(f"Terjadi kesalahan: {e}")
+        return
+
+    await submit_job(query.message, update.effective_user.id, "cek status MSISDN", "cekstatus_text",
+                     {"text_data": text_data, "output_format": choice})
+
+# Job bulk: cek nomor hanya sekali; hasil ditulis per baris ke file dan spool
+@job_type("cekstatus_text")
+async def cekstatus_text_job(job, bot):
+    text_data, choice = job.params["text_data"], job.params["output_format"]
     try:
-        # Tampilkan konfirmasi bahwa pilihan sudah diterima
-        await query.message.reply_text(f"Anda memilih format output: {choice.upper()}.\nSedang memproses...")
-
-        # Proses sesuai dengan pilihan format
-        if choice == "csv":
-            output_filename = read_from_textarea_csv(text_data)
-        elif choice == "txt":
-            output_filename = read_from_textarea_txt(text_data)
-        elif choice == "excel":
-            output_filename = read_from_textarea_excel(text_data)
-
-        # Kirimkan file hasil kepada pengguna
-        with open(output_filename, "rb") as output_file:
-            await query.message.reply_document(output_file, filename=output_filename)
-
-        await query.message.reply_text("Proses selesai! File hasil telah dikirimkan.")
+        status_message = await bot.send_message(
+            job.chat_id, f"Job {job.id}: format output {choice.upper()}.\nSedang memproses..."
+        )
+        spool = ResultSpool.for_job(job, "cekstatus", "sim")
+        stats = BatchStats(spool)
+        job.spool, job.kind, job.output_format = spool.path, "sim", choice
+        job.progress = JobProgress(status_message, "sim", choice, spool=spool,
+                                   total=len(msisdns_from_text(text_data)), job_id=job.id)
+        await bulk_jobs.save(job)
+        output_filename = await write_job(read_from_textarea(text_data, stats), "sim", choice, spool=spool, progress=job.progress)
+        job.summary = stats.summary()
+        # Format lain hanya ditawarkan jika pengguna belum mengirim data baru selama job berjalan;
+        # spool tetap disimpan untuk delta dan dihapus oleh sweep
+        session = await load_session(job.user_id)
+        if session.get('text_data') == text_data:
+            session['job_spool'] = spool.path
+            session['job_summary'] = stats.summary()
+            await save_session(job.user_id, session)
+        await send_results(bot, job.chat_id, output_filename, stats.summary())
     except Exception as e:
         logger.error(f"Error during output processing: {e}")
-        await query.message.reply_text(f"Terjadi kesalahan: {e}")
+        await bot.send_message(job.chat_id, f"Terjadi kesalahan: {e}")
+        raise
+
 
+# Stop the bulk job workers before closing the upstream pools and shared state they use
+async def shutdown(application):
+    await bulk_jobs.stop()
+    await close_clients()
+    await close_cache()
+    await close_state()
 
 # Fungsi utama untuk menjalankan bot
 def main():
@@ -235,14 +175,21 @@ def main():
     if not TOKEN:
         raise ValueError("TOKEN bot tidak ditemukan di environment variables.")
     
-    application = Application.builder().token(TOKEN).build()
+    # Updates are handled concurrently, so one long lookup does not hold up other chats
+    application = (Application.builder().token(TOKEN).concurrent_updates(True)
+                   .post_init(bulk_jobs.start).post_shutdown(shutdown).build())
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_textarea))  # Menangani input MSISDN
-    application.add_handler(CallbackQueryHandler(button))  # Menangani pilihan output format
+    application.add_handler(CallbackQueryHandler(button, pattern="^(csv|txt|excel)$"))  # Menangani pilihan output format
+    application.add_handler(CallbackQueryHandler(handle_partial_request, pattern="^partial:"))  # Kirim hasil sementara
+    application.add_handlers(upload_handlers(kinds=("sim",)))  # Menangani file CSV/XLSX yang diunggah
+    application.add_handler(CommandHandler("status", job_status))  # Status job bulk
+    application.add_handler(CommandHandler("cancel", job_cancel))  # Batalkan job bulk
 
     logger.info("Bot is starting...")
-    application.run_polling()
+    log_startup(STARTED_AT)
+    run_bot(application)
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,27 @@
+import time
+STARTED_AT = time.perf_counter()  # Measured before the heavy imports below
+
+import asyncio
 import os
-import csv
-import requests
-from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 import logging
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
-import pandas as pd
+from core.bulk import BatchStats, check_sim_batch, iter_nik_records
+from core.cache import close_cache, sim_cache
+from core.delta import DeltaError, load_delta, previous_source
+from core.jobs import bulk_jobs, job_cancel, job_status, job_type, submit_job
+from core.metrics import log_startup
+from core.normalize import check_nik_pair
+from core.progress import JobProgress, handle_partial_request
+from core.results import SimRecord
+from core.runner import run_bot
+from core.session import SessionTooLarge, load_session, save_session, session_stats
+from core.state import close_state
+from core.sheets import stream_nik_pairs
+from core.writers import ResultSpool, read_spool, render_results, send_output, write_job
+from core.upstream import check_nik_kk, close_clients
+from core.uploads import upload_handlers
 
 # Load environment variables
 load_dotenv()
@@ -23,122 +37,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# URLs for NIK/KK checking
-NIK_URL_POST = "https://myim3.indosatooredoo.com/ceknomor/checkForm"
-NIK_URL_RESULT = "https://myim3.indosatooredoo.com/ceknomor/result"
-
-# URL for SIM status checking
-SIM_STATUS_URL = "https://tri.co.id/api/v1/information/sim-status"
-
-# Function to check NIK/KK
-def check_nik_kk(nik, kk):
-    headers = {
-        "Host": "myim3.indosatooredoo.com",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.6778.140 Safari/537.36",
-        "Origin": "https://myim3.indosatooredoo.com",
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "Referer": "https://myim3.indosatooredoo.com/ceknomor/",
-    }
-
-    payload = {
-        "nik": nik,
-        "kk": kk,
-        "g-recaptcha-response": "",
-        "send": "PERIKSA"
-    }
-
-    with requests.Session() as session:
-        post_response = session.post(NIK_URL_POST, headers=headers, data=payload, allow_redirects=False)
-
-        if post_response.status_code == 302:
-            get_response = session.get(NIK_URL_RESULT, headers=headers)
-
-            if get_response.status_code == 200:
-                soup = BeautifulSoup(get_response.text, "html.parser")
-                nik_result = soup.find("h6")
-                nomor_result = soup.find("ul", class_="list-unstyled margin-5-top")
-
-                if nik_result and nomor_result:
-                    nomor_list = nomor_result.find_all("li")
-                    nomor = [nomor.text.strip() for nomor in nomor_list]
-                    sisa = 3 - len(nomor)
-
-                    return {
-                        "status": True,
-                        "nik": nik_result.text.strip(),
-                        "nomor": nomor,
-                        "sisa": sisa
-                    }
-                else:
-                    return {
-                        "status": False,
-                        "message": "Data tidak ditemukan atau format respons berubah.",
-                        "sisa": 3
-                    }
-            else:
-                return {
-                    "status": False,
-                    "message": f"GET request failed with status code {get_response.status_code}",
-                    "sisa": 3
-                }
-        else:
-            return {
-                "status": False,
-                "message": f"POST request failed with status code {post_response.status_code}",
-                "sisa": 3
-            }
-
-# Function to check SIM status
-def check_sim_status(msisdn):
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.6778.140 Safari/537.36",
-        "Origin": "https://tri.co.id",
-        "Referer": "https://tri.co.id/",
-    }
-
-    payload = {
-        "action": "MSISDN_STATUS_WEB",
-        "input1": "",
-        "input2": "",
-        "language": "ID",
-        "msisdn": msisdn
-    }
-
-    try:
-        response = requests.post(SIM_STATUS_URL, headers=headers, json=payload, timeout=10)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error during request: {e}")
-        return {
-            "status": False,
-            "message": f"Request Error: {e}"
-        }
-
-    if response.status_code == 200:
-        data = response.json()
-        if data.get("status"):
-            iccid = data["data"].get("iccid", "")
-            last_4_iccid = iccid[-4:] if iccid else "Tidak diketahui"
-            return {
-                "status": True,
-                "card_status": data["data"].get("cardStatus", "Tidak diketahui"),
-                "activation_status": data["data"].get("activationStatus", "Tidak diketahui"),
-                "last_4_iccid": last_4_iccid,
-            }
-        else:
-            return {
-                "status": False,
-                "message": data.get("message", "Tidak diketahui")
-            }
-    else:
-        return {
-            "status": False,
-            "message": f"HTTP Error {response.status_code}"
-        }
-
 # Command handler for /ceknik
 async def cek_nik(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Received /ceknik with args: {context.args}")
@@ -147,61 +45,38 @@ async def cek_nik(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Format salah. Gunakan: /ceknik <NIK> <KK>")
         return
 
-    nik, kk = args[0], args[1]
-    result = check_nik_kk(nik, kk)
-    if result["status"]:
-        nomor_list = "\n".join(result["nomor"])
+    # NIK/KK yang formatnya salah tidak perlu dikirim ke server
+    nik, kk, reason = check_nik_pair(args[0], args[1])
+    if reason:
+        await update.message.reply_text(f"Gagal: {reason}")
+        return
+
+    result = await check_nik_kk(nik, kk)
+    if result.status:
+        nomor_list = "\n".join(result.nomor)
         await update.message.reply_text(
-            f"NIK: {nik}\nNomor: {nomor_list}\nSisa: {result['sisa']}"
+            f"NIK: {nik}\nNomor: {nomor_list}\nSisa: {result.sisa}"
         )
     else:
-        await update.message.reply_text(f"Gagal: {result['message']}")
-
-async def ceknik_process_spreadsheet_from_url(url):
-    response = requests.get(url)
-    response.raise_for_status()
-
-    # Parsing CSV
-    data = response.text.splitlines()
-    reader = csv.reader(data)
-    next(reader, None)  # Skip header
-
-    results = [["NIK", "KK", "Status", "Nomor", "Message", "Sisa"]]
-
-    for row in reader:
-        nik, kk = row[0], row[1]
-        result = check_nik_kk(nik, kk)  # Asumsikan check_nik_kk didefinisikan dengan benar
-
-        if result["status"]:
-            results.append([nik, kk, "Berhasil", ", ".join(result["nomor"]), "", result["sisa"]])
-        else:
-            results.append([nik, kk, "Gagal", "", result["message"], result["sisa"]])
-
-    return results
-async def ceknik_save_results(results, output_format):
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-    if output_format == "csv":
-        filename = f"results_{timestamp}.csv"
-        with open(filename, "w", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerows(results)
-    elif output_format == "txt":
-        filename = f"results_{timestamp}.txt"
-        with open(filename, "w") as file:
-            for row in results:
-                file.write(" | ".join(row) + "\n")
-    elif output_format == "excel":
-        import pandas as pd
-        filename = f"results_{timestamp}.xlsx"
-        df = pd.DataFrame(results, columns=["NIK", "KK", "Status", "Nomor", "Message", "Sisa"])
-        df.to_excel(filename, index=False)
-
-    return filename
-
-# Function to handle URL input and format choice
+        await update.message.reply_text(f"Gagal: {result.message}")
+
+def ceknik_process_spreadsheet_from_url(url, stats=None, carry=None):
+    # Rows are parsed and checked while the CSV export is still downloading
+    return iter_nik_records(stream_nik_pairs(url), stats=stats, carry=carry)
+
+# Output format buttons; the prefix tells NIK/KK jobs apart from MSISDN jobs
+def format_keyboard(prefix=""):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("CSV", callback_data=f"{prefix}csv"),
+         InlineKeyboardButton("TXT", callback_data=f"{prefix}txt"),
+         InlineKeyboardButton("Excel", callback_data=f"{prefix}excel")]
+    ])
+
+# Function to handle URL input and format choice. "<URL> [ID job sebelumnya]",
+# or replying to an earlier result file, turns on delta mode.
 async def ceknik_handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_input = " ".join(context.args).strip()
+    args = context.args
+    user_input = args[0].strip() if args else ""
 
     if not user_input.startswith("https://"):
         await update.message.reply_text(
@@ -212,18 +87,31 @@ async def ceknik_handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    context.user_data['spreadsheet_url'] = user_input
-
-    keyboard = [
-        [InlineKeyboardButton("CSV", callback_data="csv"),
-         InlineKeyboardButton("TXT", callback_data="txt"),
-         InlineKeyboardButton("Excel", callback_data="excel")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    session = await load_session(update.effective_user.id)
+    session['spreadsheet_url'] = user_input
+    # The earlier spool is left for the sweep, so a later run can still diff against its job
+    session.pop('ceknik_spool', None)
+    previous = previous_source(update.message, args[1] if len(args) > 1 else None)
+    if previous is not None:
+        session['ceknik_previous'] = previous
+    else:
+        session.pop('ceknik_previous', None)
+    await save_session(update.effective_user.id, session)
 
     await update.message.reply_text(
         "URL diterima. Pilih format output:",
-        reply_markup=reply_markup
+        reply_markup=format_keyboard("ceknik:")
+    )
+
+# Function to send a finished NIK/KK file and offer the other formats
+async def ceknik_send_results(bot, chat_id, filename, summary):
+    await send_output(bot.send_document, filename, chat_id=chat_id)
+
+    await bot.send_message(
+        chat_id,
+        f"Proses selesai: {summary}. File telah dikirimkan.\n"
+        "Pilih format lain jika diperlukan:",
+        reply_markup=format_keyboard("ceknik:")
     )
 
 # Function to handle format choice
@@ -231,76 +119,106 @@ async def ceknik_handle_format_choice(update: Update, context: ContextTypes.DEFA
     query = update.callback_query
     await query.answer()
 
-    output_format = query.data
-    spreadsheet_url = context.user_data.get('spreadsheet_url')
+    output_format = query.data.removeprefix("ceknik:")
+    session = await load_session(update.effective_user.id)
+    spreadsheet_url = session.get('spreadsheet_url')
 
     if not spreadsheet_url:
         await query.edit_message_text("URL spreadsheet tidak ditemukan. Silakan ulangi proses.")
         return
 
-    try:
-        await query.edit_message_text("Sedang memproses... Mohon tunggu.")
-
-        # Fetch and process the spreadsheet data
-        results = await ceknik_process_spreadsheet_from_url(spreadsheet_url)
-        filename = await ceknik_save_results(results, output_format)
-
-        with open(filename, "rb") as file:
-            await query.message.reply_document(file, filename=filename)
+    # Other formats are rendered from the finished job's spool
+    spool_path = session.get('ceknik_spool')
+    if spool_path is not None:
+        try:
+            filename = await asyncio.to_thread(render_results, read_spool(spool_path, "nik"), "nik", output_format,
+                                               prefix="results")
+            await ceknik_send_results(context.bot, query.message.chat_id, filename, session.get('ceknik_summary', ''))
+        except Exception as e:
+            logger.error(f"Error: {e}")
+            await query.message.reply_text(f"Terjadi kesalahan: {e}")
+        return
 
-        await query.message.reply_text("Proses selesai. File telah dikirimkan.")
+    await query.edit_message_reply_markup(reply_markup=None)
+    params = {"url": spreadsheet_url, "output_format": output_format}
+    description = "cek NIK/KK spreadsheet"
+    if session.get('ceknik_previous'):
+        params["previous"] = session['ceknik_previous']
+        description += " (delta)"
+    await submit_job(query.message, update.effective_user.id, description, "ceknik_sheet", params)
+
+# Bulk job: the sheet is checked once and rows are written as they finish
+@job_type("ceknik_sheet")
+async def ceknik_sheet_job(job, bot):
+    spreadsheet_url, output_format = job.params["url"], job.params["output_format"]
+    try:
+        carry, status_text = await load_delta(job, bot, "nik")
+        status_message = await bot.send_message(job.chat_id, status_text)
+        spool = ResultSpool.for_job(job, "ceknik", "nik")
+        stats = BatchStats(spool, carry)
+        job.spool, job.kind, job.output_format = spool.path, "nik", output_format
+        job.progress = JobProgress(status_message, "nik", output_format, spool=spool, job_id=job.id)
+        await bulk_jobs.save(job)
+        filename = await write_job(ceknik_process_spreadsheet_from_url(spreadsheet_url, stats, carry), "nik",
+                                   output_format, prefix="results", spool=spool, progress=job.progress)
+        job.summary = stats.summary()
+        # Offer the other formats only if no new URL was sent while the job ran;
+        # the spool stays either way for delta re-checks against this job
+        session = await load_session(job.user_id)
+        if session.get('spreadsheet_url') == spreadsheet_url:
+            session['ceknik_spool'] = spool.path
+            session['ceknik_summary'] = stats.summary()
+            await save_session(job.user_id, session)
+        await ceknik_send_results(bot, job.chat_id, filename, stats.summary())
+    except DeltaError:
+        # load_delta has already reported it to the chat
+        raise
     except Exception as e:
         logger.error(f"Error: {e}")
-        await query.message.reply_text(f"Terjadi kesalahan: {e}")
+        await bot.send_message(job.chat_id, f"Terjadi kesalahan: {e}")
+        raise
+
 # Command handler for /nomor
 async def nomor(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Ambil argumen yang dikirimkan bersama perintah /nomor
     args = context.args
     logger.info(f"nomor yang diterima: {args}")
 
+    # "-f" melewati cache dan memaksa cek ulang ke server
+    use_cache = "-f" not in args
+    args = [arg for arg in args if arg != "-f"]
+
     # Pastikan ada minimal dua nomor
     if len(args) < 2:
         await update.message.reply_text("Format salah. Harap masukkan minimal dua nomor. Gunakan: /nomor <Nomor1> <Nomor2> [Nomor3] ...")
         return
 
-    # Proses setiap nomor yang diterima
-    results = []
-    for nomor in args:
-        msisdn = nomor.strip()  # Pastikan ada spasi yang tidak perlu dibuang
-
-        # Cek jika nomor diawali dengan "08", ubah menjadi format internasional
-        if msisdn.startswith("08"):
-            msisdn = "628" + msisdn[2:]
-
-        logger.info(f"Processing MSISDN: {msisdn}")
-        
-        # Asumsi Anda sudah memiliki fungsi check_sim_status untuk memeriksa status kartu
-        result = check_sim_status(msisdn)
+    logger.info(f"Processing {len(args)} MSISDN")
 
-        # Menyusun hasil untuk setiap nomor
-        if result["status"]:
-            results.append(f"Nomor: {msisdn}\nStatus Kartu: {result['card_status']}\nStatus Aktivasi: {result['activation_status']}\nICCID Terakhir: {result['last_4_iccid']}\n")
-        else:
-            results.append(f"Nomor: {msisdn}\nGagal diproses: {result['message']}\n")
+    # Cek beberapa nomor sekaligus, hasil tetap sesuai urutan input. Nomor
+    # dinormalisasi ke format 628..., yang tidak valid langsung ditolak
+    records = await check_sim_batch(args, use_cache=use_cache)
 
     # Jika ada hasil, kirimkan pilihan format output
-    if results:
-        context.user_data['results'] = results  # Simpan hasil untuk diproses lebih lanjut
-        keyboard = [
-            [InlineKeyboardButton("CSV", callback_data="csv"),
-             InlineKeyboardButton("TXT", callback_data="txt"),
-             InlineKeyboardButton("Excel", callback_data="excel")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    if records:
+        session = await load_session(update.effective_user.id)
+        session['results'] = [record.to_json() for record in records]  # Simpan hasil untuk diproses lebih lanjut
+        try:
+            await save_session(update.effective_user.id, session)
+        except SessionTooLarge as e:
+            await update.message.reply_text(str(e))
+            return
         await update.message.reply_text(
             "Pilih format output yang diinginkan:",
-            reply_markup=reply_markup
+            reply_markup=format_keyboard()
         )
     else:
         await update.message.reply_text("Tidak ada hasil yang ditemukan.")
+
 async def handle_msisdn_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Mengecek apakah bot sedang menunggu MSISDN
-    if context.user_data.get('waiting_for_msisdn', False):
+    session = await load_session(update.effective_user.id)
+    if session.get('waiting_for_msisdn', False):
         text_data = update.message.text.strip()
         logger.info(f"Text data received: {text_data}")
         
@@ -311,21 +229,18 @@ async def handle_msisdn_input(update: Update, context: ContextTypes.DEFAULT_TYPE
         try:
             logger.info(f"User {update.effective_user.id} input MSISDN data via /nomor command.")
             
+            # Simpan data yang dikirim pengguna untuk pemrosesan selanjutnya
+            session['text_data'] = text_data
+            session['waiting_for_msisdn'] = False  # Reset after receiving MSISDN
+            await save_session(update.effective_user.id, session)
+
             # Kirimkan pilihan format output menggunakan inline keyboard
-            keyboard = [
-                [InlineKeyboardButton("CSV", callback_data="csv"),
-                 InlineKeyboardButton("TXT", callback_data="txt"),
-                 InlineKeyboardButton("Excel", callback_data="excel")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
             await update.message.reply_text(
                 "Pilih format output yang diinginkan:",
-                reply_markup=reply_markup
+                reply_markup=format_keyboard()
             )
-
-            # Simpan data yang dikirim pengguna untuk pemrosesan selanjutnya
-            context.user_data['text_data'] = text_data
-            context.user_data['waiting_for_msisdn'] = False  # Reset after receiving MSISDN
+        except SessionTooLarge as e:
+            await update.message.reply_text(str(e))
         except Exception as e:
             logger.error(f"Error during MSISDN processing: {e}")
             await update.message.reply_text(f"Terjadi kesalahan: {e}")
@@ -337,67 +252,76 @@ async def handle_format_selection(update: Update, context: ContextTypes.DEFAULT_
     format_choice = query.data  # Format yang dipilih (csv, txt, excel)
     logger.info(f"User memilih format: {format_choice}")
 
-    # Ambil hasil sebelumnya dari context
-    results = context.user_data.get('results', [])
-    if not results:
+    # Ambil hasil sebelumnya dari sesi pengguna
+    records = [SimRecord.from_json(values) for values in (await load_session(update.effective_user.id)).get('results', [])]
+    if not records:
         await query.answer("Tidak ada data untuk diproses.")
         return
 
-    # Persiapkan file berdasarkan format yang dipilih
-    file_path = None
-    if format_choice == "csv":
-        # Membuat konten CSV
-        file_content = "\n".join(results)
-        file_path = "output.csv"
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(file_content)
-    elif format_choice == "txt":
-        # Membuat konten TXT
-        file_content = "\n".join(results)
-        file_path = "output.txt"
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(file_content)
-    elif format_choice == "excel":
-        # Menggunakan pandas untuk membuat file Excel
-        # Mengubah hasil menjadi dataframe pandas
-        df = pd.DataFrame([r.split("\n") for r in results], columns=["Nomor", "Status Kartu", "Status Aktivasi", "ICCID Terakhir", "Pesan"])
-        file_path = "output.xlsx"
-        df.to_excel(file_path, index=False, engine='openpyxl')  # Simpan ke Excel menggunakan openpyxl
-
-    # Kirimkan file yang telah dibuat
-    if file_path:
-        await query.answer(f"Format {format_choice.upper()} dipilih.")
-        with open(file_path, "rb") as f:
-            await query.message.reply_document(f)
-
-        # Hapus file setelah dikirim untuk menjaga kebersihan
-        os.remove(file_path)
-        
+    # Render file dari hasil yang tersimpan, tanpa mengecek ulang nomor
+    await query.answer(f"Format {format_choice.upper()} dipilih.")
+    file_path = await asyncio.to_thread(render_results, records, "sim", format_choice,
+                                        prefix=f"output_{update.effective_user.id}")
+    await send_output(query.message.reply_document, file_path)
+
+# Command handler for /cachestats
+async def cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    stats = sim_cache.stats()
+    sessions = session_stats()
+    await update.message.reply_text(
+        f"Cache status SIM:\nEntri: {stats['size']}\nHit: {stats['hits']}\nMiss: {stats['misses']}\n"
+        f"Hit rate: {stats['hit_rate']:.0%}\n\n"
+        f"Sesi: {sessions['in_memory']} di memori ({sessions['memory_bytes'] / 1024:.1f} KiB), "
+        f"{sessions['spilled']} di disk"
+    )
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Bot aktif. Berikut adalah perintah yang dapat Anda gunakan:\n\n"
         "/ceknik <NIK> <KK> - Untuk memeriksa NIK dan KK\n"
-        "/urlceknik <URL> - Untuk memeriksa data NIK/KK dari spreadsheet\n"
-        "/nomor <MSISDN> - Untuk memeriksa status SIM. Kirimkan MSISDN untuk memeriksa status SIM."
+        "/urlceknik <URL> [ID job sebelumnya] - Untuk memeriksa data NIK/KK dari spreadsheet "
+        "(balas file hasil sebelumnya atau sebut ID job untuk hanya mengecek baris baru, gagal, atau yang sudah lama)\n"
+        "/nomor <MSISDN> - Untuk memeriksa status SIM. Kirimkan MSISDN untuk memeriksa status SIM.\n"
+        "/nomor -f <MSISDN> - Memeriksa ulang tanpa memakai cache\n"
+        "/cachestats - Statistik cache status SIM dan sesi\n"
+        "Unggah file CSV/XLSX berisi kolom MSISDN atau NIK dan KK untuk pemeriksaan massal\n"
+        "/status [ID] - Melihat status job spreadsheet\n"
+        "/cancel <ID> - Membatalkan job spreadsheet"
     )
 
+# Stop the bulk job workers before closing the upstream pools and shared state they use
+async def shutdown(application):
+    await bulk_jobs.stop()
+    await close_clients()
+    await close_cache()
+    await close_state()
+
 # Main function to run the bot
 def main():
     TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
     if not TOKEN:
         raise ValueError("Telegram bot token not found in environment variables.")
 
-    application = Application.builder().token(TOKEN).build()
+    # Updates are handled concurrently, so one long lookup does not hold up other chats
+    application = (Application.builder().token(TOKEN).concurrent_updates(True)
+                   .post_init(bulk_jobs.start).post_shutdown(shutdown).build())
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("ceknik", cek_nik))
     application.add_handler(CommandHandler("urlceknik", ceknik_handle_url))
 
     application.add_handler(CommandHandler("nomor", nomor))
+    application.add_handler(CommandHandler("cachestats", cache_stats))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_msisdn_input))
-    application.add_handler(CallbackQueryHandler(handle_format_selection))
+    application.add_handler(CallbackQueryHandler(ceknik_handle_format_choice, pattern="^ceknik:"))
+    application.add_handler(CallbackQueryHandler(handle_partial_request, pattern="^partial:"))
+    application.add_handlers(upload_handlers())
+    application.add_handler(CommandHandler("status", job_status))
+    application.add_handler(CommandHandler("cancel", job_cancel))
+    application.add_handler(CallbackQueryHandler(handle_format_selection, pattern="^(csv|txt|excel)$"))
 
     logger.info("Bot is starting...")
-    application.run_polling()
+    log_startup(STARTED_AT)
+    run_bot(application)
 
 if __name__ == "__main__":
     main()